@@ -0,0 +1,51 @@
+"""
+Startup time and final distortion of the OptSpace
+initializations (svds and randomized) on random
+low-rank tables with missing entries.
+
+    python benchmarks/init_benchmark.py --samples 2000 --features 20000
+
+(with deicode installed, e.g. pip install -e .)
+"""
+import time
+import click
+import numpy as np
+from scipy.sparse import coo_matrix
+from deicode._optspace import svd_init
+from deicode._optspace_sparse import optspace
+
+
+@click.command()
+@click.option('--samples', default=2000, help='Number of rows.')
+@click.option('--features', default=20000, help='Number of columns.')
+@click.option('--rank', default=3, help='Rank of the table.')
+@click.option('--density', default=.05, help='Fraction observed.')
+@click.option('--iterations', default=5, help='OptSpace iterations.')
+@click.option('--seed', default=0, help='Random seed.')
+def benchmark(samples, features, rank, density, iterations, seed):
+    rand = np.random.RandomState(seed)
+    n, m = samples, features
+    nnz = int(density * n * m)
+    rows = rand.randint(0, n, nnz)
+    cols = rand.randint(0, m, nnz)
+    U = rand.randn(n, rank)
+    V = rand.randn(m, rank)
+    data = np.einsum('ij,ij->i', U[rows], V[cols])
+    M_E = coo_matrix((data, (rows, cols)), shape=(n, m))
+    M_E.sum_duplicates()
+
+    print('init\tstartup (s)\tfit (s)\tfinal distortion')
+    for init in ['svds', 'randomized']:
+        start = time.time()
+        svd_init(M_E, rank, init=init, random_state=seed)
+        startup = time.time() - start
+        start = time.time()
+        dist = optspace(M_E, rank, iterations, 1e-8, init=init,
+                        random_state=seed)[-1]
+        fit = time.time() - start
+        final = dist[np.flatnonzero(dist)[-1]]
+        print('%s\t%.3f\t%.3f\t%.3e' % (init, startup, fit, final))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,76 +1,246 @@
 import numpy as np
 from numpy.matlib import repmat
-from numpy.linalg import norm
+from numpy.linalg import norm, LinAlgError
+from scipy.linalg import cho_factor, cho_solve
 from scipy.sparse.linalg import svds
+from sklearn.utils import check_random_state
 
 
-def optspace(M_E, r, niter, tol):\
-
+def optspace(M_E, r, niter, tol, solver='lstsq', dtype=np.float64,
+             init='svds', random_state=None, callback=None,
+             checkpoint=None, resume=None):
     """
     Parameters
     ----------
-    M_E, r, niter, tol
+    M_E, r, niter, tol, solver, dtype, init, random_state, callback,
+    checkpoint, resume
+
+    M_E is cast to dtype and the computation
+    is carried out in that precision.
+
+    callback(k, X, S, Y, dist) is called with the
+    solution and distortion a run of niter=k would
+    return, for k = 1 (the initialization) to the
+    last iteration. The run stops early when it returns True.
+
+    checkpoint(state) is called with the state of the run
+    (see save_state) after the initialization and after
+    each iteration, a run given one of those states as
+    resume continues from it bit for bit.
 
     Returns
     -------
     X, S, Y
     """
 
-    M_E = M_E.copy()
+    M_E = np.array(M_E, dtype=dtype, order='C')
     M_E[np.isnan(M_E)] = 0
-    E = (np.abs(M_E) > 0).astype(np.int)
+    E = M_E != 0
 
-    return _optspace(M_E, E, r, niter, tol, sign=-1)
+    return _optspace(M_E, E, r, niter, tol, sign=-1, solver=solver,
+                     init=init, random_state=random_state,
+                     callback=callback, checkpoint=checkpoint,
+                     resume=resume)
 
 
-def _optspace(M_E, E, r, niter, tol, sign=1):
+def _optspace(M_E, E, r, niter, tol, sign=1, solver='lstsq',
+              init='svds', random_state=None, callback=None,
+              checkpoint=None, resume=None):
     """
     Parameters
     ----------
-    M_E, r, niter, tol
+    M_E, r, niter, tol, solver, init, random_state, callback,
+    checkpoint, resume
+
+    E is a boolean mask of the observed entries,
+    the dtype of M_E is kept throughout.
 
     Returns
     -------
     X, S, Y
     """
     rescal_param = np.sqrt((np.count_nonzero(E) * r) / (norm(M_E, 'fro') ** 2))
+    rescal_param = M_E.dtype.type(rescal_param)
     M_E = M_E * rescal_param
 
-    X0, S0, Y0 = svds(M_E, r, which='LM')
-
     n, m = M_E.shape
-    nnz = np.count_nonzero(E)
+    rows, cols = np.nonzero(E)
+    nnz = len(rows)
     eps = nnz / np.sqrt(m * n)
-    X0 = X0 * np.sqrt(n)
-    Y0 = Y0 * np.sqrt(m)
-    S0 = S0 / eps
     m0 = 10000
     rho = eps * n
-    X, Y = X0, Y0.T
-    S = getoptS(X, Y, M_E, E)
-    ft = M_E - X.dot(S).dot(Y.T)
-    dist = np.zeros(niter + 1)
-    dist[0] = norm(np.multiply(ft, E), 'fro') / np.sqrt(nnz)
 
-    for i in range(1, niter):
-        W, Z = gradF_t(X, Y, S, M_E, E, m0, rho)
+    # iteration workspace, the masked residual R is computed
+    # once per iteration and shared by the gradient, the
+    # line search and the distortion
+    R = np.empty_like(M_E)
+
+    if resume is None:
+        X0, S0, Y0 = svd_init(M_E, r, init=init, random_state=random_state)
+        X0 = X0 * np.sqrt(n)
+        Y0 = Y0 * np.sqrt(m)
+        S0 = S0 / eps
+        X, Y = X0, Y0.T
+
+        S = getoptS(X, Y, M_E, E, solver=solver, rows=rows, cols=cols)
+        residual(X, S, Y, M_E, E, out=R)
+        dist = np.zeros(niter + 1)
+        dist[0] = norm(R, 'fro') / np.sqrt(nnz)
+        stop = callback is not None and callback(
+            1, X, S / rescal_param, Y, dist[0])
+        save_state(checkpoint, 0, X, S, Y, dist, rescal_param)
+        start = niter if stop else 1
+    else:
+        X, S, Y, dist, start = resume_state(resume, M_E.shape, r, niter,
+                                            tol, rescal_param)
+        residual(X, S, Y, M_E, E, out=R)
+
+    for i in range(start, niter):
+        W, Z = gradF_t(X, Y, S, M_E, E, m0, rho, R=R)
 
         # Line search for the optimum jump length
-        t = getoptT(X, W, Y, Z, S, M_E, E, m0, rho)
+        t = getoptT(X, W, Y, Z, S, M_E, E, m0, rho, R=R)
         X = X - sign * t * W
         Y = Y - sign * t * Z
 
-        S = getoptS(X, Y, M_E, E)
+        S = getoptS(X, Y, M_E, E, solver=solver, S0=S,
+                    rows=rows, cols=cols)
 
         # Compute the distortion
-        ft = M_E - X.dot(S).dot(Y.T)
-        dist[i + 1] = norm(np.multiply(ft, E), 'fro') / np.sqrt(nnz)
-        if(dist[i + 1] < tol):
+        residual(X, S, Y, M_E, E, out=R)
+        dist[i + 1] = norm(R, 'fro') / np.sqrt(nnz)
+        stop = callback is not None and callback(
+            i + 1, X, S / rescal_param, Y, dist[i + 1])
+        save_state(checkpoint, i, X, S, Y, dist, rescal_param)
+        if(stop or dist[i + 1] < tol):
             break
     S = S / rescal_param
     return X, S, Y, dist
 
 
+def save_state(checkpoint, iteration, X, S, Y, dist, rescal_param):
+    """
+    Parameters
+    ----------
+    checkpoint, iteration, X, S, Y, dist, rescal_param
+
+    Calls checkpoint (if any) with the state of the
+    run after iteration, S is the rescaled S.
+    """
+    if checkpoint is not None:
+        checkpoint({'X': X, 'S': S, 'Y': Y, 'iteration': iteration,
+                    'dist': dist, 'rescal_param': rescal_param})
+
+
+def resume_state(state, shape, r, niter, tol, rescal_param):
+    """
+    Parameters
+    ----------
+    state, shape, r, niter, tol, rescal_param
+
+    Returns
+    -------
+    X, S, Y, dist and the first iteration
+    of a run resumed from a saved state
+
+    Raises
+    ------
+    ValueError if the state is not of a run on the same input
+    """
+    X, S, Y = state['X'], state['S'], state['Y']
+    if (X.shape != (shape[0], r) or Y.shape != (shape[1], r)
+            or state['rescal_param'] != rescal_param):
+        raise ValueError('checkpoint does not match the input')
+    dist = np.zeros(niter + 1)
+    k = min(len(state['dist']), niter + 1)
+    dist[:k] = state['dist'][:k]
+    start = int(state['iteration']) + 1
+    if 1 < start <= niter and dist[start] < tol:
+        # the run had converged
+        start = niter
+    return X, S, Y, dist, start
+
+
+def svd_init(M_E, r, init='svds', random_state=None):
+    """
+    Parameters
+    ----------
+    M_E, r, init, random_state
+
+    init is 'svds' (ARPACK, the starting vector is drawn
+    from random_state when it is given), 'randomized'
+    (see randomized_svds) or a tuple of factors (U, s, V)
+    to warm start from.
+
+    Returns
+    -------
+    U, s, Vt of the rank r truncated SVD of M_E
+    """
+    if isinstance(init, tuple):
+        # only the column spaces of the factors are
+        # used, S is solved for from them
+        U, s, V = init
+        U = np.linalg.qr(U)[0].astype(M_E.dtype)
+        V = np.linalg.qr(V)[0].astype(M_E.dtype)
+        return U, s, V.T
+    if init == 'svds':
+        v0 = None
+        if random_state is not None:
+            v0 = check_random_state(random_state).uniform(
+                -1, 1, min(M_E.shape))
+        return svds(M_E, r, which='LM', v0=v0)
+    if init == 'randomized':
+        return randomized_svds(M_E, r, random_state=random_state)
+    raise ValueError('init must be one of svds or randomized')
+
+
+def randomized_svds(A, r, n_oversamples=10, n_iter=4, random_state=None):
+    """
+    Parameters
+    ----------
+    A, r, n_oversamples, n_iter, random_state
+
+    A randomized range finder with n_iter power iterations
+    (Halko, Martinsson and Tropp 2011). A may be a
+    numpy.ndarray, a scipy.sparse matrix or a LinearOperator,
+    it is only used through products with blocks of
+    r + n_oversamples vectors.
+
+    Returns
+    -------
+    U, s, Vt ordered as in svds (increasing s)
+    """
+    random_state = check_random_state(random_state)
+    n, m = A.shape
+    k = min(r + n_oversamples, n, m)
+    Q = random_state.normal(size=(m, k)).astype(A.dtype)
+    Q, _ = np.linalg.qr(A.dot(Q))
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(A.T.dot(Q))
+        Q, _ = np.linalg.qr(A.dot(Q))
+    U, s, Vt = np.linalg.svd(A.T.dot(Q).T, full_matrices=False)
+    U = Q.dot(U[:, :r])
+    return U[:, ::-1], s[:r][::-1], Vt[:r][::-1]
+
+
+def residual(X, S, Y, M_E, E, out=None):
+    """
+    Parameters
+    ----------
+    X, S, Y, M_E, E, out
+
+    Returns
+    -------
+    (M_E - XSY) masked by E, written into out if given
+    """
+    if out is None:
+        out = np.empty(M_E.shape, dtype=np.result_type(X, M_E))
+    np.dot(X.dot(S), Y.T, out=out)
+    np.subtract(M_E, out, out=out)
+    np.multiply(out, E, out=out)
+    return out
+
+
 def F_t(X, Y, S, M_E, E, m0, rho):
     """
     Parameters
@@ -97,18 +267,34 @@ def G(X, m0, r):
     ----------
     X, m0, r
     """
-    z = np.sum(X**2, axis=1) / (2 * m0 * r)
+    return _G(np.sum(X**2, axis=1), m0, r)
+
+
+def _G(sq, m0, r):
+    """
+    Parameters
+    ----------
+    sq, m0, r
+
+    sq are the squared row norms of X in G
+    """
+    # a python int scalar above 2**16 would promote
+    # float32 to float64, so it is cast to the dtype
+    z = sq / sq.dtype.type(2 * m0 * r)
     y = np.exp((z - 1)**2) - 1
     y[z < 1] = 0
     y[y == np.inf] = 0
     return y.sum()
 
 
-def gradF_t(X, Y, S, M_E, E, m0, rho):
+def gradF_t(X, Y, S, M_E, E, m0, rho, R=None):
     """
     Parameters
     ----------
-    X, Y, S, M_E, E, m0, rho
+    X, Y, S, M_E, E, m0, rho, R
+
+    R is the masked residual from residual,
+    computed here if it is not given.
 
     Returns
     -------
@@ -119,12 +305,15 @@ def gradF_t(X, Y, S, M_E, E, m0, rho):
 
     XS = X.dot(S)
     YS = Y.dot(S.T)
-    XSY = XS.dot(Y.T)
-
-    Qx = X.T.dot(np.multiply((M_E - XSY), E)).dot(YS) / n
-    Qy = Y.T.dot(np.multiply((M_E - XSY), E).T).dot(XS) / m
-    W = np.multiply((XSY - M_E), E).dot(YS) + X.dot(Qx) + rho * Gp(X, m0, r)
-    Z = np.multiply((XSY - M_E), E).T.dot(XS) + Y.dot(Qy) + rho * Gp(Y, m0, r)
+    if R is None:
+        R = residual(X, S, Y, M_E, E)
+    RYS = R.dot(YS)
+    RXS = R.T.dot(XS)
+
+    Qx = X.T.dot(RYS) / X.dtype.type(n)
+    Qy = Y.T.dot(RXS) / Y.dtype.type(m)
+    W = -RYS + X.dot(Qx) + rho * Gp(X, m0, r)
+    Z = -RXS + Y.dot(Qy) + rho * Gp(Y, m0, r)
     return W, Z
 
 
@@ -136,60 +325,254 @@ def Gp(X, m0, r):
 
 
     """
-    z = np.sum(X**2, axis=1) / (2 * m0 * r)
+    z = np.sum(X**2, axis=1) / X.dtype.type(2 * m0 * r)
     z = 2 * np.multiply(np.exp((z - 1)**2), (z - 1))
 
     z[z < 0] = 0
     z = z.reshape(len(z), 1)
-    out = np.multiply(X, repmat(z, 1, r)) / (m0 * r)
+    out = np.multiply(X, repmat(z, 1, r)) / X.dtype.type(m0 * r)
     return out
 
 
-def getoptT(X, W, Y, Z, S, M_E, E, m0, rho):
+def getoptT(X, W, Y, Z, S, M_E, E, m0, rho, R=None, chunk_size=2 ** 20):
     """
     Parameters
     ----------
-    X, W, Y, Z, S, M_E, E, m0, rho
+    X, W, Y, Z, S, M_E, E, m0, rho, R, chunk_size
+
+    R is the masked residual from residual, computed
+    here if it is not given. The line search terms are
+    accumulated over blocks of rows with at most
+    chunk_size elements.
+    """
+    n, r = X.shape
+    m, r = Y.shape
+
+    XS = X.dot(S)
+    WS = W.dot(S)
+    if R is None:
+        R = residual(X, S, Y, M_E, E)
+
+    # the terms are negated along with R = -(XSY - M_E)
+    # which leaves the squared residual unchanged
+    step = max(1, min(n, chunk_size // m))
+    buf1 = np.empty((step, m), dtype=R.dtype)
+    buf2 = np.empty((step, m), dtype=R.dtype)
+    coef = np.zeros(5)
+    for start in range(0, n, step):
+        block = slice(start, start + step)
+        k = len(R[block])
+        e1, e2 = buf1[:k], buf2[:k]
+        np.dot(-WS[block], Y.T, out=e1)
+        np.dot(-XS[block], Z.T, out=e2)
+        np.add(e1, e2, out=e1)
+        np.multiply(e1, E[block], out=e1)
+        np.dot(-WS[block], Z.T, out=e2)
+        np.multiply(e2, E[block], out=e2)
+        coef += quartic(R[block], e1, e2)
+
+    return linesearch(coef, X, W, Y, Z, m0, rho)
+
+
+def quartic(e0, e1, e2):
+    """
+    Parameters
+    ----------
+    e0, e1, e2
+
+    Returns
+    -------
+    coefficients (highest power first) of
+    sum((e0 + t * e1 + t^2 * e2)^2) / 2 - sum(e0^2) / 2
+    """
+    return np.array([np.vdot(e2, e2) / 2,
+                     np.vdot(e1, e2),
+                     np.vdot(e1, e1) / 2 + np.vdot(e0, e2),
+                     np.vdot(e0, e1),
+                     0])
+
+
+def linesearch(coef, X, W, Y, Z, m0, rho):
     """
+    Parameters
+    ----------
+    coef, X, W, Y, Z, m0, rho
 
+    Notes
+    -----
+    On the observed entries
+    (X + tW)S(Y + tZ)^T - M_E = e0 + t * e1 + t^2 * e2
+    so the residual part of F_t(X + tW, Y + tZ) is a
+    quartic in t with coefficients coef from quartic.
+    With the quadratics for the row norms used by G
+    computed once, each step of the Armijo search
+    costs O(n + m).
+    """
+    n, r = X.shape
     norm2WZ = norm(W, 'fro')**2 + norm(Z, 'fro')**2
 
+    xx, xw, ww = np.sum(X**2, axis=1), np.sum(X * W, axis=1), \
+        np.sum(W**2, axis=1)
+    yy, yz, zz = np.sum(Y**2, axis=1), np.sum(Y * Z, axis=1), \
+        np.sum(Z**2, axis=1)
+    g0 = _G(xx, m0, r) + _G(yy, m0, r)
+
     # this is the resolution limit (t > 2**-20
     n_intervals = 20
-    f = np.zeros(n_intervals + 1)
-    f[0] = F_t(X, Y, S, M_E, E, m0, rho)
     t = -1e-1
 
     for i in range(n_intervals):
 
-        f[i + 1] = F_t(X + t * W, Y + t * Z, S, M_E, E, m0, rho)
-        if((f[i + 1] - f[0]) <= .5 * t * norm2WZ):
+        df = np.polyval(coef, t) + rho * (
+            _G(xx + t * (2 * xw + t * ww), m0, r)
+            + _G(yy + t * (2 * yz + t * zz), m0, r) - g0)
+        if(df <= .5 * t * norm2WZ):
             return t
         t = t / 2
     return t
 
 
-def getoptS(X, Y, M_E, E):
+def getoptS(X, Y, M_E, E, solver='lstsq', S0=None, rows=None, cols=None):
     """
     Parameters
     ----------
-    X, Y, M_E, E
+    X, Y, M_E, E, solver, S0, rows, cols
 
+    rows and cols are the indices of the observed
+    entries in E, computed here if they are not given.
     """
     n, r = X.shape
+    m, r = Y.shape
 
-    C = np.ravel(X.T.dot(M_E).dot(Y))
-    A = np.zeros((r * r, r * r))
-    for i in range(r):
-        for j in range(r):
-            ind = j * r + i
-            x = X[:, i].reshape(1, len(X[:, i]))
-            y = Y[:, j].reshape(len(Y[:, j]), 1)
-            tmp = np.multiply((y.dot(x)).T, E)
-            temp = X.T.dot(tmp).dot(Y)
-            A[:, ind] = np.ravel(temp)
+    C = np.ravel(X.T.dot(M_E.dot(Y)))
+    if rows is None or cols is None:
+        rows, cols = np.nonzero(E)
+    A = getoptS_system(X, Y, rows, cols)
 
-    S = np.linalg.lstsq(A, C, rcond=1e-12)[0]
-    S = S.reshape((r, r)).T
+    S = solveS(A, C, X, Y, len(rows) / (n * m), solver=solver, S0=S0)
+    S = S.reshape((r, r))
 
     return S
+
+
+def getoptS_system(X, Y, rows, cols, chunk_size=2 ** 20):
+    """
+    Parameters
+    ----------
+    X, Y, rows, cols, chunk_size
+
+    Returns
+    -------
+    A
+
+    Notes
+    -----
+    Builds the (r^2, r^2) normal equations of the S
+    sub-problem from the observed entries (rows, cols).
+    With K the row-wise Khatri-Rao product of X[rows]
+    and Y[cols] this is A = K^T K, so the system is
+    solved for S flattened in row-major order. K is
+    built in chunks of at most chunk_size elements.
+    """
+    n, r = X.shape
+
+    A = np.zeros((r * r, r * r), dtype=X.dtype)
+    step = max(1, chunk_size // (r * r))
+    for start in range(0, len(rows), step):
+        K = np.einsum('ki,kj->kij',
+                      X[rows[start:start + step]],
+                      Y[cols[start:start + step]]).reshape(-1, r * r)
+        A += K.T.dot(K)
+
+    return A
+
+
+def solveS(A, C, X, Y, p, solver='lstsq', S0=None):
+    """
+    Parameters
+    ----------
+    A, C, X, Y, p, solver, S0
+
+    Returns
+    -------
+    S flattened in row-major order
+
+    Notes
+    -----
+    A is the symmetric positive (semi-)definite
+    system built by getoptS_system and p is the
+    fraction of observed entries.
+
+    solver='lstsq' uses an SVD based least squares solve.
+    solver='cholesky' uses a Cholesky factorization.
+    solver='cg' uses conjugate gradient preconditioned by
+    (X^T X kron Y^T Y) * p, the expectation of A under
+    uniform sampling, warm started from S0.
+
+    Both 'cholesky' and 'cg' fall back to 'lstsq'
+    when the system is ill-conditioned.
+    """
+    # relative cutoff on the singular values of A,
+    # loosened for single precision
+    rcond = max(1e-12, np.finfo(A.dtype).eps)
+
+    if solver == 'cholesky':
+        try:
+            c, low = cho_factor(A)
+            d = np.abs(np.diag(c))
+            if d.min() > 0 and (d.max() / d.min())**2 < 1 / rcond:
+                return cho_solve((c, low), C)
+        except LinAlgError:
+            pass
+    elif solver == 'cg':
+        try:
+            Gx = np.linalg.inv(X.T.dot(X))
+            Gy = np.linalg.inv(Y.T.dot(Y))
+        except LinAlgError:
+            Gx = Gy = None
+        if Gx is not None:
+            r = X.shape[1]
+
+            def precond(v):
+                return np.ravel(Gx.dot(v.reshape((r, r))).dot(Gy)) / p
+
+            x0 = np.zeros_like(C) if S0 is None else np.ravel(S0)
+            x, converged = _pcg(A, C, precond, x0,
+                                tol=max(1e-10, 10 * rcond),
+                                maxiter=2 * r * r)
+            if converged:
+                return x
+    elif solver != 'lstsq':
+        raise ValueError('solver must be one of lstsq, cholesky or cg')
+
+    return np.linalg.lstsq(A, C, rcond=rcond)[0]
+
+
+def _pcg(A, b, precond, x0, tol=1e-10, maxiter=100):
+    """
+    Parameters
+    ----------
+    A, b, precond, x0, tol, maxiter
+
+    Returns
+    -------
+    x, converged
+    """
+    x = np.array(x0, dtype=b.dtype)
+    res = b - A.dot(x)
+    z = precond(res)
+    d = z.copy()
+    rz = res.dot(z)
+    stop = tol * norm(b)
+    for i in range(maxiter):
+        if norm(res) <= stop:
+            return x, True
+        Ad = A.dot(d)
+        alpha = rz / d.dot(Ad)
+        x += alpha * d
+        res -= alpha * Ad
+        z = precond(res)
+        rz_new = res.dot(z)
+        d = z + (rz_new / rz) * d
+        rz = rz_new
+    return x, norm(res) <= stop
@@ -0,0 +1,589 @@
+import os
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import LinearOperator
+from deicode._optspace import (G, Gp, getoptS_system, solveS,
+                               linesearch, quartic, svd_init,
+                               save_state, resume_state)
+from deicode.store import CSRStore
+
+
+def optspace(M_E, r, niter, tol, solver='lstsq', dtype=np.float64,
+             block_size=1000, n_jobs=1, init='svds', random_state=None,
+             callback=None, checkpoint=None, resume=None):
+    """
+    Parameters
+    ----------
+    M_E, r, niter, tol, solver, dtype, block_size, n_jobs,
+    init, random_state, callback, checkpoint, resume
+
+    M_E is a scipy.sparse matrix or a deicode.store.CSRStore,
+    only the stored (non-nan and nonzero) entries are treated
+    as observed. The values are cast to dtype and the
+    computation is carried out in that precision.
+
+    A CSRStore is never loaded in memory, each iteration
+    streams over it in blocks of block_size rows and only
+    the factors are held in memory.
+
+    With n_jobs > 1 (or -1 for all the cores) the row
+    blocks are evaluated on a pool of n_jobs threads
+    and the partial results reduced after each pass.
+
+    init may also be a tuple of factors (U, s, V) to
+    warm start from, only the column spaces of U and V
+    are used. callback, checkpoint and resume are as
+    in deicode._optspace.optspace.
+
+    Returns
+    -------
+    X, S, Y, dist
+    """
+
+    M_E = observed_entries(M_E, dtype, block_size)
+
+    return _optspace(M_E, r, niter, tol, sign=-1, solver=solver,
+                     n_jobs=n_jobs, init=init, random_state=random_state,
+                     callback=callback, checkpoint=checkpoint,
+                     resume=resume)
+
+
+def _optspace(M_E, r, niter, tol, sign=1, solver='lstsq', n_jobs=1,
+              **options):
+    """
+    Parameters
+    ----------
+    M_E, r, niter, tol, solver, n_jobs, options
+
+    options are the init, random_state, callback,
+    checkpoint and resume of _iterate.
+
+    M_E is a scipy.sparse.coo_matrix of the observed entries
+    or a _StoreEntries streaming them in blocks of rows.
+    With n_jobs > 1 an in-memory M_E is split in _RowBlocks.
+    Residuals, gradients and the objective are only
+    evaluated on those entries so the cost of each
+    iteration grows with nnz * r and not n * m.
+
+    Returns
+    -------
+    X, S, Y, dist
+    """
+    n, m = M_E.shape
+    nnz, sum_sq = _stats(M_E)
+    rescal_param = np.sqrt((nnz * r) / sum_sq)
+    rescal_param = M_E.dtype.type(rescal_param)
+    M_E = _scaled(M_E, rescal_param)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if n_jobs > 1:
+        with ThreadPoolExecutor(n_jobs) as executor:
+            if isinstance(M_E, coo_matrix):
+                M_E = _RowBlocks(M_E, 4 * n_jobs)
+            M_E.executor, M_E.n_jobs = executor, n_jobs
+            return _iterate(M_E, r, niter, tol, sign, solver,
+                            nnz, rescal_param, **options)
+    return _iterate(M_E, r, niter, tol, sign, solver,
+                    nnz, rescal_param, **options)
+
+
+def _iterate(M_E, r, niter, tol, sign, solver, nnz, rescal_param,
+             init='svds', random_state=None, callback=None,
+             checkpoint=None, resume=None):
+    """
+    Parameters
+    ----------
+    M_E, r, niter, tol, sign, solver, nnz, rescal_param,
+    init, random_state, callback, checkpoint, resume
+
+    The OptSpace iterations on the rescaled entries M_E.
+
+    Returns
+    -------
+    X, S, Y, dist
+    """
+    n, m = M_E.shape
+    eps = nnz / np.sqrt(m * n)
+    m0 = 10000
+    rho = eps * n
+    if resume is None:
+        X0, S0, Y0 = svd_init(_operator(M_E), r, init=init,
+                              random_state=random_state)
+        X0 = X0 * np.sqrt(n)
+        Y0 = Y0 * np.sqrt(m)
+        S0 = S0 / eps
+        X, Y = X0, Y0.T
+        S = getoptS(X, Y, M_E, solver=solver)
+        dist = np.zeros(niter + 1)
+        dist[0] = distortion(X, S, Y, M_E)
+        stop = callback is not None and callback(
+            1, X, S / rescal_param, Y, dist[0])
+        save_state(checkpoint, 0, X, S, Y, dist, rescal_param)
+        start = niter if stop else 1
+    else:
+        X, S, Y, dist, start = resume_state(resume, M_E.shape, r, niter,
+                                            tol, rescal_param)
+
+    for i in range(start, niter):
+        W, Z = gradF_t(X, Y, S, M_E, m0, rho)
+
+        # Line search for the optimum jump length
+        t = getoptT(X, W, Y, Z, S, M_E, m0, rho)
+        X = X - sign * t * W
+        Y = Y - sign * t * Z
+
+        S = getoptS(X, Y, M_E, solver=solver, S0=S)
+
+        # Compute the distortion
+        dist[i + 1] = distortion(X, S, Y, M_E)
+        stop = callback is not None and callback(
+            i + 1, X, S / rescal_param, Y, dist[i + 1])
+        save_state(checkpoint, i, X, S, Y, dist, rescal_param)
+        if(stop or dist[i + 1] < tol):
+            break
+    S = S / rescal_param
+    return X, S, Y, dist
+
+
+def observed_entries(M_E, dtype=np.float64, block_size=1000):
+    """
+    Parameters
+    ----------
+    M_E, dtype, block_size
+
+    M_E is a numpy.ndarray, a scipy.sparse matrix
+    or a deicode.store.CSRStore.
+
+    Returns
+    -------
+    coo_matrix (or _StoreEntries for a CSRStore) of the
+    non-nan and nonzero entries of M_E cast to dtype
+    """
+    if isinstance(M_E, CSRStore):
+        return _StoreEntries(M_E, block_size, dtype=dtype)
+    if isinstance(M_E, np.ndarray):
+        return coo_matrix(np.nan_to_num(M_E, nan=0).astype(dtype))
+    return _observed(M_E.tocoo(copy=True).astype(dtype))
+
+
+def fold_in(M_E, V, S, axis=0):
+    """
+    Parameters
+    ----------
+    M_E, V, S, axis
+
+    M_E are observed entries (see observed_entries)
+    and V the fixed factor, the (N,rank) features
+    for axis=0 or the (M,rank) samples for axis=1.
+
+    Returns
+    -------
+    the least squares factor of each row (axis=0) or
+    column (axis=1) of M_E ~ USV given the other factor,
+    rows or columns without observed entries are zero.
+    """
+    A, C = fold_in_system(M_E, V, S, axis=axis)
+    return solve_rows(A, C).astype(V.dtype)
+
+
+def fold_in_system(M_E, V, S, axis=0):
+    """
+    Parameters
+    ----------
+    M_E, V, S, axis
+
+    Returns
+    -------
+    A, C the (K,rank,rank) normal equations and (K,rank)
+    right hand sides of each row (axis=0) or column (axis=1)
+    of the fold_in least squares. They are sums over the
+    observed entries and add up across batches of entries.
+    """
+    r = S.shape[0]
+    B = V.dot(S.T) if axis == 0 else V.dot(S)
+    outer = np.einsum('ij,ik->ijk', B, B).reshape((-1, r * r))
+
+    def block_system(start, block):
+        rows = _rows(start, block)
+        pattern = _masked(block, np.ones(block.nnz))
+        if axis == 0:
+            return rows, pattern.dot(outer), block.dot(B)
+        return rows, pattern.T.dot(outer[rows]), block.T.dot(B[rows])
+
+    n = M_E.shape[axis]
+    A = np.zeros((n, r * r))
+    C = np.zeros((n, r))
+    for rows, block_A, block_C in _map(block_system, M_E):
+        if axis == 0:
+            A[rows], C[rows] = block_A, block_C
+        else:
+            A += block_A
+            C += block_C
+    return A.reshape((n, r, r)), C
+
+
+def solve_rows(A, C):
+    """
+    Parameters
+    ----------
+    A, C
+
+    Returns
+    -------
+    the (pseudo-inverse) solution of each
+    of the (K,rank,rank) systems A x = C
+    """
+    return np.einsum('ijk,ik->ij', np.linalg.pinv(A), C)
+
+
+class _StoreEntries(object):
+
+    def __init__(self, store, block_size=1000, scale=1, dtype=None):
+        """
+        The observed entries of a CSRStore read in blocks
+        of block_size rows. Iterating yields (first row,
+        coo_matrix) for each block, the nan and zero
+        entries are dropped and the values are cast
+        to dtype and multiplied by scale.
+        """
+        self.store = store
+        self.block_size = block_size
+        self.scale = scale
+        self.dtype = np.dtype(store.dtype if dtype is None else dtype)
+        self.shape = store.shape
+        self.executor = None
+        self.n_jobs = 1
+
+    def __iter__(self):
+        for start, block in self.store.blocks(self.block_size):
+            block = _observed(block.tocoo().astype(self.dtype))
+            if self.scale != 1:
+                block.data *= self.scale
+            yield start, block
+
+
+class _RowBlocks(object):
+
+    def __init__(self, M_E, n_blocks):
+        """
+        An in-memory coo_matrix split in n_blocks
+        blocks of rows holding about the same number
+        of entries. Iterating yields (first row,
+        coo_matrix) for each block.
+        """
+        M_E = M_E.tocsr()
+        n = M_E.shape[0]
+        bounds = np.searchsorted(M_E.indptr,
+                                 np.linspace(0, M_E.nnz, n_blocks + 1))
+        bounds = np.unique(np.clip(np.r_[0, bounds[1:-1], n], 0, n))
+        self.blocks = [(start, M_E[start:stop].tocoo())
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.dtype = M_E.dtype
+        self.shape = M_E.shape
+        self.executor = None
+        self.n_jobs = 1
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+
+def _observed(M_E):
+    """
+    Parameters
+    ----------
+    M_E
+
+    Returns
+    -------
+    coo_matrix of the non-nan and nonzero entries of M_E
+    """
+    M_E.sum_duplicates()
+    observed = ~np.isnan(M_E.data) & (M_E.data != 0)
+    return coo_matrix((M_E.data[observed],
+                       (M_E.row[observed], M_E.col[observed])),
+                      shape=M_E.shape)
+
+
+def _blocks(M_E):
+    """
+    Parameters
+    ----------
+    M_E
+
+    Returns
+    -------
+    (first row, coo_matrix) for each block of rows of M_E,
+    an in-memory coo_matrix is a single block.
+    """
+    if isinstance(M_E, coo_matrix):
+        return [(0, M_E)]
+    return M_E
+
+
+def _rows(start, block):
+    """ the rows of the factor X matching a block """
+    return slice(start, start + block.shape[0])
+
+
+def _map(func, M_E):
+    """
+    Parameters
+    ----------
+    func, M_E
+
+    Returns
+    -------
+    list of func(start, block) for each block of rows of M_E,
+    evaluated on the thread pool of M_E when it has one.
+    """
+    executor = getattr(M_E, 'executor', None)
+    if executor is None:
+        return [func(start, block) for start, block in _blocks(M_E)]
+    results, futures = [], deque()
+    for start, block in _blocks(M_E):
+        futures.append(executor.submit(func, start, block))
+        # bounds the blocks held in memory when streaming a store
+        if len(futures) >= 2 * M_E.n_jobs:
+            results.append(futures.popleft().result())
+    results.extend(future.result() for future in futures)
+    return results
+
+
+def _stats(M_E):
+    """
+    Parameters
+    ----------
+    M_E
+
+    Returns
+    -------
+    the number of observed entries and their sum of squares
+    """
+    def block_stats(start, block):
+        if not np.isfinite(block.data).all():
+            raise ValueError('Contains either np.inf or -np.inf')
+        return block.nnz, np.sum(block.data.astype(np.float64) ** 2)
+
+    nnz, sum_sq = 0, 0
+    for block_nnz, block_sum_sq in _map(block_stats, M_E):
+        nnz += block_nnz
+        sum_sq += block_sum_sq
+    return nnz, sum_sq
+
+
+def _scaled(M_E, scale):
+    """
+    Parameters
+    ----------
+    M_E, scale
+
+    Returns
+    -------
+    M_E with the observed values multiplied by scale
+    """
+    if isinstance(M_E, coo_matrix):
+        return _masked(M_E, M_E.data * scale)
+    return _StoreEntries(M_E.store, M_E.block_size,
+                         scale=M_E.scale * scale, dtype=M_E.dtype)
+
+
+def _operator(M_E):
+    """
+    Parameters
+    ----------
+    M_E
+
+    Returns
+    -------
+    M_E or a LinearOperator over its blocks (for svd_init)
+    """
+    if isinstance(M_E, coo_matrix):
+        return M_E
+
+    def matmat(V):
+        out = np.zeros((M_E.shape[0],) + V.shape[1:], dtype=M_E.dtype)
+        for rows, block_out in _map(
+                lambda start, block: (_rows(start, block), block.dot(V)),
+                M_E):
+            out[rows] = block_out
+        return out
+
+    def rmatmat(U):
+        out = np.zeros((M_E.shape[1],) + U.shape[1:], dtype=M_E.dtype)
+        for block_out in _map(
+                lambda start, block: block.T.dot(U[_rows(start, block)]),
+                M_E):
+            out += block_out
+        return out
+
+    return LinearOperator(M_E.shape, matvec=matmat, rmatvec=rmatmat,
+                          matmat=matmat, rmatmat=rmatmat, dtype=M_E.dtype)
+
+
+def _masked(M_E, values):
+    """
+    Parameters
+    ----------
+    M_E, values
+
+    Returns
+    -------
+    coo_matrix with the sparsity pattern of M_E
+    holding values.
+    """
+    return coo_matrix((values, (M_E.row, M_E.col)), shape=M_E.shape)
+
+
+def _residual(X, S, Y, M_E):
+    """
+    Parameters
+    ----------
+    X, S, Y, M_E
+
+    Returns
+    -------
+    M_E - XSY evaluated on the observed entries only
+    """
+    return M_E.data - np.einsum('ij,ij->i', X.dot(S)[M_E.row], Y[M_E.col])
+
+
+def _residual_sq(X, S, Y, M_E):
+    """
+    Parameters
+    ----------
+    X, S, Y, M_E
+
+    Returns
+    -------
+    the number of observed entries and
+    their sum of squared residuals
+    """
+    def block_sq(start, block):
+        residual = _residual(X[_rows(start, block)], S, Y, block)
+        return block.nnz, np.sum(residual ** 2)
+
+    nnz, sum_sq = 0, 0
+    for block_nnz, block_sum_sq in _map(block_sq, M_E):
+        nnz += block_nnz
+        sum_sq += block_sum_sq
+    return nnz, sum_sq
+
+
+def distortion(X, S, Y, M_E):
+    """
+    Parameters
+    ----------
+    X, S, Y, M_E
+
+    Returns
+    -------
+    root mean squared residual of the observed entries
+    """
+    nnz, sum_sq = _residual_sq(X, S, Y, M_E)
+    return np.sqrt(sum_sq / nnz)
+
+
+def F_t(X, Y, S, M_E, m0, rho):
+    """
+    Parameters
+    ----------
+    X, Y, S, M_E, m0, rho
+
+    Notes
+    -----
+    M ~ XSY
+    """
+    n, r = X.shape
+    out1 = _residual_sq(X, S, Y, M_E)[1] / 2
+    out2 = rho * G(Y, m0, r)
+    out3 = rho * G(X, m0, r)
+    out = out1 + out2 + out3
+    return out
+
+
+def gradF_t(X, Y, S, M_E, m0, rho):
+    """
+    Parameters
+    ----------
+    X, Y, S, M_E, m0, rho
+
+    Returns
+    -------
+    W, Z
+    """
+    n, r = X.shape
+    m, r = Y.shape
+
+    XS = X.dot(S)
+    YS = Y.dot(S.T)
+
+    def block_grad(start, block):
+        rows = _rows(start, block)
+        R = _masked(block, _residual(X[rows], S, Y, block))
+        return rows, R.dot(YS), R.T.dot(XS[rows])
+
+    RYS = np.zeros_like(X)
+    RXS = np.zeros_like(Y)
+    for rows, block_RYS, block_RXS in _map(block_grad, M_E):
+        RYS[rows] = block_RYS
+        RXS += block_RXS
+
+    Qx = X.T.dot(RYS) / X.dtype.type(n)
+    Qy = Y.T.dot(RXS) / Y.dtype.type(m)
+    W = -RYS + X.dot(Qx) + rho * Gp(X, m0, r)
+    Z = -RXS + Y.dot(Qy) + rho * Gp(Y, m0, r)
+    return W, Z
+
+
+def getoptT(X, W, Y, Z, S, M_E, m0, rho):
+    """
+    Parameters
+    ----------
+    X, W, Y, Z, S, M_E, m0, rho
+    """
+
+    def block_quartic(start, block):
+        rows, cols = _rows(start, block), block.col
+        XS = X[rows].dot(S)[block.row]
+        WS = W[rows].dot(S)[block.row]
+        e0 = -_residual(X[rows], S, Y, block)
+        e1 = (np.einsum('ij,ij->i', WS, Y[cols])
+              + np.einsum('ij,ij->i', XS, Z[cols]))
+        e2 = np.einsum('ij,ij->i', WS, Z[cols])
+        return quartic(e0, e1, e2)
+
+    coef = np.sum(_map(block_quartic, M_E), axis=0)
+
+    return linesearch(coef, X, W, Y, Z, m0, rho)
+
+
+def getoptS(X, Y, M_E, solver='lstsq', S0=None):
+    """
+    Parameters
+    ----------
+    X, Y, M_E, solver, S0
+
+    """
+    n, r = X.shape
+    m, r = Y.shape
+
+    def block_system(start, block):
+        rows = _rows(start, block)
+        C = np.ravel(X[rows].T.dot(block.dot(Y)))
+        A = getoptS_system(X[rows], Y, block.row, block.col)
+        return block.nnz, C, A
+
+    nnz = 0
+    C = np.zeros(r * r, dtype=X.dtype)
+    A = np.zeros((r * r, r * r), dtype=X.dtype)
+    for block_nnz, block_C, block_A in _map(block_system, M_E):
+        nnz += block_nnz
+        C += block_C
+        A += block_A
+
+    S = solveS(A, C, X, Y, nnz / (n * m), solver=solver, S0=S0)
+    S = S.reshape((r, r))
+
+    return S
@@ -0,0 +1,44 @@
+import multiprocessing
+
+# the read-only input of the pool workers
+_shared = None
+
+
+def map_shared(func, args, shared, n_jobs=1):
+    """
+    Parameters
+    ----------
+    func, args, shared, n_jobs
+
+    func is a module level function of (shared, arg).
+    With n_jobs > 1 (or -1 for all the cores) it is
+    evaluated on a pool of n_jobs processes. Where fork
+    is available shared is inherited by the workers
+    (copy-on-write, never pickled), otherwise it is
+    pickled once per worker.
+
+    Returns
+    -------
+    list of func(shared, arg) for each arg in args
+    """
+    if n_jobs == -1:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = min(n_jobs, len(args))
+    if n_jobs <= 1:
+        return [func(shared, arg) for arg in args]
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        context = multiprocessing.get_context()
+    with context.Pool(n_jobs, initializer=_init,
+                      initargs=(shared,)) as pool:
+        return pool.starmap(_call, [(func, arg) for arg in args])
+
+
+def _init(shared):
+    global _shared
+    _shared = shared
+
+
+def _call(func, arg):
+    return func(_shared, arg)
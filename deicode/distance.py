@@ -0,0 +1,165 @@
+import numpy as np
+from scipy.spatial.distance import cdist
+
+
+def condensed_distance(sample_weights, dtype=np.float64, block_size=1000):
+    """
+
+    The condensed (upper triangle) form of the distances
+    between the sample loadings of an OptSpace fit, as
+    given by scipy.spatial.distance.pdist. It is computed
+    in blocks of rows so only block_size*M distances are
+    held at once on top of the M(M-1)/2 of the output.
+
+    Parameters
+    ----------
+
+    sample_weights: numpy.ndarray - the sample loadings
+    of shape (M,rank), e.g. OptSpace.sample_weights
+
+    dtype: numpy.dtype, optional : Default is float64
+    The precision of the output, float32 halves its size.
+
+    block_size: int, optional : Default is 1000
+    The number of rows computed at once.
+
+    Returns
+    -------
+
+    numpy.ndarray of shape (M(M-1)/2,)
+
+    Examples
+    --------
+
+    >>> from deicode.distance import condensed_distance
+    >>> from skbio import DistanceMatrix
+    >>> dist = condensed_distance(opt.sample_weights, dtype=np.float32)
+    >>> dm = DistanceMatrix(dist, ids=sample_ids)
+
+    """
+
+    n = sample_weights.shape[0]
+    out = np.empty(n * (n - 1) // 2, dtype=dtype)
+    _fill(sample_weights, out, block_size, condensed=True)
+    return out
+
+
+def distance_to_disk(sample_weights, path, dtype=np.float32,
+                     block_size=1000, condensed=False):
+    """
+
+    Streams the distances between the sample loadings
+    of an OptSpace fit to a .npy file in blocks of rows,
+    the matrix is never held in memory.
+
+    Parameters
+    ----------
+
+    sample_weights: numpy.ndarray - the sample loadings
+    of shape (M,rank), e.g. OptSpace.sample_weights
+
+    path: str - the .npy file written
+
+    dtype: numpy.dtype, optional : Default is float32
+    The precision of the distances written.
+
+    block_size: int, optional : Default is 1000
+    The number of rows computed and written at once.
+
+    condensed: bool, optional : Default is False
+    Write the condensed form (see condensed_distance)
+    instead of the square (M,M) matrix.
+
+    Returns
+    -------
+
+    numpy.memmap - the distances, memory-mapped read-only
+    from path (e.g. np.load(path, mmap_mode='r'))
+
+    """
+
+    n = sample_weights.shape[0]
+    shape = (n * (n - 1) // 2,) if condensed else (n, n)
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                    shape=shape)
+    _fill(sample_weights, out, block_size, condensed=condensed)
+    out.flush()
+    del out
+    return np.load(path, mmap_mode='r')
+
+
+def knn_distance(sample_weights, n_neighbors, block_size=1000):
+    """
+
+    The nearest neighbors of each sample in the sample
+    loadings of an OptSpace fit, by brute force in blocks
+    of rows so only block_size*M distances are held at once.
+
+    Parameters
+    ----------
+
+    sample_weights: numpy.ndarray - the sample loadings
+    of shape (M,rank), e.g. OptSpace.sample_weights
+
+    n_neighbors: int - the neighbors kept per sample,
+    the sample itself is not one of its neighbors
+
+    block_size: int, optional : Default is 1000
+    The number of rows computed at once.
+
+    Returns
+    -------
+
+    indices: numpy.ndarray - the rows of the neighbors of
+    each sample, nearest first. Of shape (M,n_neighbors)
+
+    distances: numpy.ndarray - their distances.
+    Of shape (M,n_neighbors)
+
+    Raises
+    ------
+    ValueError
+
+    Raises an error if n_neighbors is not less than M
+        `ValueError: n_neighbors must be less than the number
+        of samples`.
+
+    """
+
+    n = sample_weights.shape[0]
+    if not 0 < n_neighbors < n:
+        raise ValueError('n_neighbors must be less than the number '
+                         'of samples')
+    indices = np.empty((n, n_neighbors), dtype=np.intp)
+    distances = np.empty((n, n_neighbors))
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = cdist(sample_weights[start:stop], sample_weights)
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = np.inf
+        nearest = np.argpartition(block, n_neighbors - 1,
+                                  axis=1)[:, :n_neighbors]
+        dist = block[rows[:, None], nearest]
+        order = np.argsort(dist, axis=1, kind='stable')
+        indices[start:stop] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:stop] = np.take_along_axis(dist, order, axis=1)
+    return indices, distances
+
+
+def _fill(sample_weights, out, block_size, condensed=False):
+    """ writes the distances in out in blocks of rows """
+
+    n = sample_weights.shape[0]
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        if not condensed:
+            out[start:stop] = cdist(sample_weights[start:stop],
+                                    sample_weights)
+            continue
+        # row i of the upper triangle is contiguous
+        # in the condensed form and starts at offset
+        block = cdist(sample_weights[start:stop],
+                      sample_weights[start + 1:])
+        for k, i in enumerate(range(start, stop)):
+            offset = i * n - i * (i + 1) // 2
+            out[offset:offset + n - i - 1] = block[k, k:]
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from sklearn.utils import check_random_state
+from deicode._optspace import svd_init
+from deicode._optspace_sparse import (optspace, observed_entries,
+                                      _masked, _residual)
+from deicode._parallel import map_shared
+from deicode.optspace import _ids
+from deicode.store import CSRStore
+
+
+def rank_selection(X, ranks=(1, 2, 3, 4, 5), iterations=(5, 10, 20),
+                   holdout=.1, n_splits=3, tol=1e-5, n_jobs=1,
+                   random_state=None):
+    """
+
+    Cross-validated selection of the rank and number of
+    iterations of OptSpace. A random fraction of the observed
+    entries is held out of each split, OptSpace is fit on the
+    rest for each rank and number of iterations and scored by
+    the reconstruction error of the held out entries.
+
+    Each rank is warm started from the fit of the rank below,
+    extended by the leading singular vectors of its residual,
+    and is fit once for the largest number of iterations, the
+    smaller ones scored on the way (as OptSpace snapshots), so
+    a split costs about one fit of the largest rank.
+
+    Parameters
+    ----------
+
+    X: rclr preprocessed table of shape (M,N) in any of the
+    input types of OptSpace.fit (nans or zeros are missing)
+
+    ranks: list of int, optional : Default is 1 to 5
+    The ranks to score.
+
+    iterations: list of int, optional : Default is (5, 10, 20)
+    The numbers of iterations to score.
+
+    holdout: float, optional : Default is 0.1
+    The fraction of the observed entries held out of each split.
+
+    n_splits: int, optional : Default is 3
+    The number of random held out splits.
+
+    tol: float, optional : Default is 1e-5
+    The OptSpace error reduction break.
+
+    n_jobs: int, optional : Default is 1
+    The number of processes the splits run on, -1 uses all
+    the cores. The observed entries are shared read-only
+    by the processes. The ranks of a split run in sequence,
+    each warm starting the next, so at most n_splits
+    processes are used.
+
+    random_state: int or numpy.random.RandomState, optional
+    The seed of the splits and of the initializations.
+
+    Returns
+    -------
+
+    errors: pandas.DataFrame - the root mean squared error of
+    the training (train_error) and held out (test_error)
+    entries of each split, rank and number of iterations.
+
+    rank: int - the rank of lowest mean held out error.
+
+    Raises
+    ------
+    ValueError
+
+    Raises an error if a rank or number of iterations is not positive
+        `ValueError: ranks and iterations must be positive`.
+
+    Raises an error if the holdout is not in (0, 1)
+        `ValueError: holdout must be between 0 and 1`.
+
+    Raises an error if a rank is not less than min(M,N)
+        `ValueError: ranks must be less than the minimum shape`.
+
+    Examples
+    --------
+
+    >>> from deicode.model_selection import rank_selection
+    >>> from deicode.preprocessing import rclr
+    >>> errors, rank = rank_selection(rclr().fit_transform(counts),
+    ...                               ranks=[2, 3, 4], n_jobs=3)
+
+    """
+
+    X = _ids(X)[0]
+    if isinstance(X, CSRStore):
+        X = X.tocsr()
+    M_E = observed_entries(X)
+    # each rank and number of iterations is scored once
+    ranks, iterations = sorted(set(ranks)), sorted(set(iterations))
+
+    if ranks[0] < 1 or iterations[0] < 1:
+        raise ValueError('ranks and iterations must be positive')
+
+    if not 0 < holdout < 1:
+        raise ValueError('holdout must be between 0 and 1')
+
+    if ranks[-1] >= min(M_E.shape):
+        raise ValueError('ranks must be less than the minimum shape')
+
+    seeds = check_random_state(random_state).randint(
+        np.iinfo(np.int32).max, size=n_splits)
+    errors = map_shared(_split, list(enumerate(seeds)),
+                        (M_E, ranks, iterations, holdout, tol), n_jobs)
+    errors = pd.concat(errors, ignore_index=True)
+    mean_error = errors.groupby(['rank', 'iterations']).test_error.mean()
+    return errors, int(mean_error.idxmin()[0])
+
+
+def _split(shared, split):
+    """ the errors of one held out split """
+
+    M_E, ranks, iterations, holdout, tol = shared
+    fold, seed = split
+    test = np.random.RandomState(seed).rand(M_E.nnz) < holdout
+    train, held = (coo_matrix((M_E.data[mask],
+                               (M_E.row[mask], M_E.col[mask])),
+                              shape=M_E.shape)
+                   for mask in (~test, test))
+
+    errors = []
+    factors = None
+    for rank in ranks:
+        init = 'svds'
+        if factors is not None:
+            init = _extend(train, factors, rank, seed)
+        scores = {}
+
+        def callback(k, X, S, Y, dist):
+            # the fit of k iterations, scored on the way
+            if k in iterations:
+                scores[k] = (_rmse(X, S, Y, train), _rmse(X, S, Y, held))
+
+        X, S, Y, _ = optspace(train, rank, iterations[-1], tol, init=init,
+                              random_state=seed, callback=callback)
+        for n_iter in iterations:
+            # a run that stopped on tol gives its final fit
+            if n_iter not in scores:
+                scores[n_iter] = (_rmse(X, S, Y, train),
+                                  _rmse(X, S, Y, held))
+            errors.append({'split': fold, 'rank': rank,
+                           'iterations': n_iter,
+                           'train_error': scores[n_iter][0],
+                           'test_error': scores[n_iter][1]})
+        factors = (X, S, Y)
+    return pd.DataFrame(errors)
+
+
+def _extend(M_E, factors, rank, seed):
+    """ factors extended to rank by the SVD of their residual """
+
+    X, S, Y = factors
+    residual = _masked(M_E, _residual(X, S, Y, M_E))
+    U, s, Vt = svd_init(residual, rank - X.shape[1], random_state=seed)
+    return np.hstack([X, U]), S, np.hstack([Y, Vt.T])
+
+
+def _rmse(X, S, Y, M_E):
+    """ root mean squared residual of the entries of M_E """
+
+    return np.sqrt(np.mean(_residual(X, S, Y, M_E) ** 2))
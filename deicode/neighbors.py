@@ -0,0 +1,129 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class SampleIndex(object):
+
+    def __init__(self, sample_weights, sample_ids=None, leafsize=16):
+        """
+
+        A KD-tree over the sample loadings of an OptSpace fit
+        for nearest-neighbor and radius queries in the rank-r
+        space, where the RPCA distances are Euclidean. Queries
+        take O(log M) per sample (for small rank) instead of
+        the O(M) of a row of the distance matrix.
+
+        Parameters
+        ----------
+
+        sample_weights: numpy.ndarray or pandas.DataFrame - the
+        sample loadings of shape (M,rank), e.g.
+        OptSpace.sample_weights or the samples of an RPCA biplot
+
+        sample_ids: list, optional : Default is None
+        The IDs of the samples, the index of sample_weights
+        when it is a pandas.DataFrame.
+
+        leafsize: int, optional : Default is 16
+        The leaf size of the KD-tree.
+
+        Examples
+        --------
+
+        >>> from deicode.optspace import OptSpace
+        >>> opt = OptSpace(rank=3).fit(table_rclr)
+        >>> index = opt.sample_index()
+        >>> indices, distances = index.kneighbors(n_neighbors=50)
+        >>> indices, distances = index.kneighbors(opt.transform(new))
+
+        """
+
+        if sample_ids is None and hasattr(sample_weights, 'index'):
+            sample_ids = list(sample_weights.index)
+        self.sample_weights = np.asarray(sample_weights, dtype=np.float64)
+        self.sample_ids = sample_ids
+        self.tree = cKDTree(self.sample_weights, leafsize=leafsize)
+
+    def kneighbors(self, X=None, n_neighbors=50):
+        """
+        The nearest indexed samples of each row of X
+
+        X: numpy.ndarray, optional : Default is None
+        Sample loadings of shape (K,rank), e.g. projected with
+        OptSpace.transform. If None the indexed samples are
+        queried, each sample is then not its own neighbor.
+
+        n_neighbors: int, optional : Default is 50
+
+        Returns
+        -------
+        indices: numpy.ndarray - the rows of the neighbors
+        of each query, nearest first. Of shape (K,n_neighbors)
+
+        distances: numpy.ndarray - their distances.
+        Of shape (K,n_neighbors)
+
+        Raises
+        ------
+        ValueError
+
+        Raises an error if there are fewer samples than n_neighbors
+            `ValueError: n_neighbors must be at most the number
+            of samples`.
+        """
+
+        n = self.sample_weights.shape[0]
+        exclude = X is None
+        if n_neighbors + exclude > n:
+            raise ValueError('n_neighbors must be at most the number '
+                             'of samples')
+        distances, indices = self.tree.query(
+            self._queries(X), k=n_neighbors + exclude)
+        distances = distances.reshape(-1, n_neighbors + exclude)
+        indices = indices.reshape(-1, n_neighbors + exclude)
+        if exclude:
+            # drop each sample, or its furthest neighbor
+            # when it ties with duplicates beyond the last
+            drop = indices == np.arange(n)[:, None]
+            drop[~drop.any(axis=1), -1] = True
+            distances = distances[~drop].reshape(n, n_neighbors)
+            indices = indices[~drop].reshape(n, n_neighbors)
+        return indices, distances
+
+    def radius_neighbors(self, X=None, radius=1.0):
+        """
+        The indexed samples within radius of each row of X
+
+        X: numpy.ndarray, optional : Default is None
+        As in kneighbors.
+
+        radius: float, optional : Default is 1.0
+
+        Returns
+        -------
+        indices: list of numpy.ndarray - the rows of
+        the neighbors of each query, nearest first
+
+        distances: list of numpy.ndarray - their distances
+        """
+
+        queries = self._queries(X)
+        indices, distances = [], []
+        for i, found in enumerate(self.tree.query_ball_point(queries,
+                                                             radius)):
+            found = np.asarray(found, dtype=np.intp)
+            if X is None:
+                found = found[found != i]
+            dist = np.sqrt(((self.sample_weights[found] -
+                             queries[i]) ** 2).sum(axis=1))
+            order = np.argsort(dist, kind='stable')
+            indices.append(found[order])
+            distances.append(dist[order])
+        return indices, distances
+
+    def _queries(self, X):
+        """ the query loadings, the indexed samples if X is None """
+
+        if X is None:
+            return self.sample_weights
+        return np.atleast_2d(np.asarray(X, dtype=np.float64))
@@ -1,13 +1,31 @@
+import os
+import json
+import time
+import multiprocessing
 import numpy as np
-from deicode._optspace import optspace
+import pandas as pd
+from biom import Table
+from deicode._optspace import optspace, svd_init
+from deicode._optspace_sparse import optspace as optspace_sparse
+from deicode._optspace_sparse import (observed_entries, fold_in,
+                                      fold_in_system, solve_rows)
+from deicode.store import CSRStore, _write_ids, _read_ids
+from deicode._parallel import map_shared
+from deicode.neighbors import SampleIndex
 from .base import _BaseImpute
+from sklearn.utils import check_random_state
 from scipy.spatial import distance
+from scipy.sparse import coo_matrix, issparse
 import warnings
 
 
 class OptSpace(_BaseImpute):
 
-    def __init__(self, rank=2, iteration=5, tol=1e-5):
+    def __init__(self, rank=2, iteration=5, tol=1e-5, solver='lstsq',
+                 dtype=np.float64, block_size=1000, n_jobs=1,
+                 init='svds', random_state=None, n_starts=1,
+                 snapshots=None, checkpoint=None, checkpoint_every=1,
+                 time_budget=None, rtol=None, memory_limit=None):
         """
 
         OptSpace is a matrix completion algorithm based on a singular value
@@ -31,6 +49,12 @@ class OptSpace(_BaseImpute):
         N = Features (i.e. OTUs, metabolites)
         M = Samples
 
+        X may also be a scipy.sparse matrix of shape (M,N),
+        a biom.Table of shape (N,M) or a deicode.store.CSRStore
+        of shape (M,N). In that case only the stored entries
+        are treated as observed and OptSpace runs on those
+        entries alone, without densifying the table.
+
         rank: int, optional : Default is 2
         The underlying rank of the default set
         to 2 as the default to prevent overfitting.
@@ -44,6 +68,88 @@ class OptSpace(_BaseImpute):
         Error reduction break, if the error reduced is
         less than this value it will return the solution
 
+        solver: str, optional : Default is 'lstsq'
+        The solver used for the S sub-problem at each iteration.
+        'lstsq' is an SVD based least squares solve, 'cholesky'
+        and 'cg' (preconditioned conjugate gradient) use the
+        symmetric positive structure of the system and are much
+        faster at high rank (rank > 20). Both fall back to
+        'lstsq' when the system is ill-conditioned.
+
+        dtype: numpy.dtype, optional : Default is np.float64
+        The floating point precision the input is cast to and
+        the computation is carried out in. np.float32 halves
+        the memory of the fit at a small loss of accuracy.
+
+        block_size: int, optional : Default is 1000
+        The number of rows (samples) of a deicode.store.CSRStore
+        read at a time. The store is streamed from disk at each
+        iteration and only the (M,rank) and (N,rank) factors
+        are held in memory during the fit.
+
+        n_jobs: int, optional : Default is 1
+        The number of threads the gradient, objective and S
+        system are evaluated on, each thread works on a block
+        of rows and the partial results are summed. -1 uses
+        all the cores. A dense X is then fit from its observed
+        (non-nan and nonzero) entries as a sparse matrix.
+
+        init: str, optional : Default is 'svds'
+        The truncated SVD the factors are initialized from.
+        'svds' is an ARPACK (Lanczos) run and 'randomized'
+        a randomized range finder with power iterations,
+        which is faster on large and wide tables.
+
+        random_state: int or numpy.random.RandomState, optional
+        The seed of the initialization. Default is None, in
+        which case the svds starting vector is not seeded.
+
+        n_starts: int, optional : Default is 1
+        The number of independent starts, each seeded from
+        random_state. The start with the lowest final
+        distortion is kept and the distortion of every start
+        is given in start_diagnostics. With n_starts > 1 the
+        starts run on a pool of n_jobs processes that share
+        the input read-only (instead of n_jobs threads per start).
+
+        snapshots: list of int, optional : Default is None
+        Numbers of iterations (at most iteration) at which the
+        solution is recorded during the single run of the fit.
+        They are in path, a dict of Snapshot by number of
+        iterations, each the fit iteration=k would give.
+
+        checkpoint: str, optional : Default is None
+        A file the state of the run (the factors, the number of
+        iterations, the distortions and the rescaling) is saved
+        to every checkpoint_every iterations. When the file
+        exists the fit resumes from it and continues exactly
+        as the uninterrupted run would, including the best
+        iterate and the stopping of rtol (the time_budget
+        counts the time before the interruption). Only the
+        snapshots after the resumed iteration are recorded.
+        A run that had stopped on rtol or time_budget is not
+        continued, the fit gives its result again.
+
+        checkpoint_every: int, optional : Default is 1
+        The number of iterations between checkpoints.
+
+        time_budget: float, optional : Default is None
+        The wall-clock time in seconds after which the
+        run stops (checked after each iteration).
+
+        rtol: float, optional : Default is None
+        The run stops once an iteration reduces the
+        distortion by less than this fraction.
+
+        With a time_budget or rtol the iterate of lowest
+        distortion is kept, not necessarily the last one.
+
+        memory_limit: float, optional : Default is None
+        The memory in MB the fit may use. The fit is not
+        started if its (approximate) projected peak exceeds it.
+        It is only checked against this estimate before the
+        fit, it is not a hard cap on the memory of the run.
+
         Returns
         -------
         U: numpy.ndarray - "Sample Loadings" or the unitary matrix
@@ -56,9 +162,26 @@ class OptSpace(_BaseImpute):
         having right singular vectors as rows. Of shape (N,rank)
 
         solution: numpy.ndarray - (U*S*V.transpose()) of shape (M,N)
+        It is computed on access, solution_blocks and predict
+        evaluate parts of it from the factors.
 
         distance: numpy.ndarray - Distance between each
         pair of the two collections of inputs. Of shape (M,M)
+        It is computed on access, deicode.distance gives
+        condensed, on-disk and nearest-neighbor forms.
+
+        sample_ids, feature_ids: list - The IDs of the rows and
+        columns of X when it is a biom.Table, pandas.DataFrame or
+        CSRStore, otherwise None. Used to align warm starts.
+
+        status: str - Why the run stopped, one of iteration,
+        tol, rtol or time_budget.
+
+        distortion_history: numpy.ndarray - The distortion after
+        the initialization (index 0) and after iteration k
+        (index k, 0 if the run stopped before it).
+
+        rescal_param: float - The scaling of X in the fit.
 
         Raises
         ------
@@ -78,6 +201,18 @@ class OptSpace(_BaseImpute):
             `ValueError: The rank must be significantly less than the
             minimum shape of the input table`.
 
+        Raises an error if solver is not one of lstsq, cholesky or cg
+            `ValueError: solver must be one of lstsq, cholesky or cg`.
+
+        Raises an error if init is not one of svds or randomized
+            `ValueError: init must be one of svds or randomized`.
+
+        Raises an error if the projected memory exceeds memory_limit
+            `ValueError: projected memory exceeds memory_limit`.
+
+        Raises an error if the checkpoint is past iteration
+            `ValueError: checkpoint is of a run past iteration`.
+
         Raises an error if rank*10> M(Samples)
             `ValueError: There are not sufficient samples to run
             must have rank*10 samples in the table`.
@@ -127,57 +262,594 @@ class OptSpace(_BaseImpute):
         self.rank = rank
         self.iteration = iteration
         self.tol = tol
+        self.solver = solver
+        self.dtype = dtype
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+        self.init = init
+        self.random_state = random_state
+        self.n_starts = n_starts
+        self.snapshots = snapshots
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.time_budget = time_budget
+        self.rtol = rtol
+        self.memory_limit = memory_limit
 
         return
 
-    def fit(self, X):
+    def fit(self, X, init=None):
         """
         Fit the model to X_sparse
+
+        init: tuple or OptSpace, optional : Default is None
+        Warm start from the factors (U, s, V) of a previous
+        fit, or from a fitted OptSpace. The rows of U and V
+        may be pandas.DataFrame indexed by the sample and
+        feature IDs, they are then aligned by ID to the IDs
+        of X (a biom.Table, pandas.DataFrame or CSRStore).
+        Samples and features new to X are folded in from the
+        other factor, those absent from X are dropped.
         """
 
-        X_sparse = X.copy().astype(np.float64)
+        X, self.sample_ids, self.feature_ids = _ids(X)
+        if isinstance(X, CSRStore):
+            # streamed from disk by the engine, never loaded
+            X_sparse = X
+        elif issparse(X):
+            # the engine works on its own copy of the observed entries
+            X_sparse = X.tocoo().astype(self.dtype, copy=False)
+        else:
+            X_sparse = X.copy().astype(self.dtype)
         self.X_sparse = X_sparse
-        self._fit()
+        self._fit(init)
         return self
 
-    def _fit(self):
+    def _fit(self, warm_start=None):
 
         # make copy for imputation, check type
         X_sparse = self.X_sparse
 
-        if not isinstance(X_sparse, np.ndarray):
-            X_sparse = np.array(X_sparse)
+        if isinstance(X_sparse, CSRStore):
+            # the observed entries are checked as they are streamed
+            values = None
+        elif issparse(X_sparse):
+            # only the observed entries are checked
+            values = X_sparse.data
+        else:
             if not isinstance(X_sparse, np.ndarray):
-                raise ValueError('Input data is should be type numpy.ndarray')
+                X_sparse = np.array(X_sparse)
+                if not isinstance(X_sparse, np.ndarray):
+                    raise ValueError(
+                        'Input data is should be type numpy.ndarray')
+            values = X_sparse
 
-        if (np.count_nonzero(X_sparse) == 0 and
-                np.count_nonzero(~np.isnan(X_sparse)) == 0):
-            raise ValueError('No missing data in the format np.nan or 0')
+        if values is not None:
+            if (np.count_nonzero(values) == 0 and
+                    np.count_nonzero(~np.isnan(values)) == 0):
+                raise ValueError('No missing data in the format np.nan or 0')
 
-        if np.count_nonzero(np.isinf(X_sparse)) != 0:
-            raise ValueError('Contains either np.inf or -np.inf')
+            if np.count_nonzero(np.isinf(values)) != 0:
+                raise ValueError('Contains either np.inf or -np.inf')
 
         if self.rank > np.min(X_sparse.shape):
             raise ValueError('rank must be less than the minimum shape')
 
+        if self.solver not in ('lstsq', 'cholesky', 'cg'):
+            raise ValueError('solver must be one of lstsq, cholesky or cg')
+
+        if self.init not in ('svds', 'randomized'):
+            raise ValueError('init must be one of svds or randomized')
+
+        if self.n_starts < 1:
+            raise ValueError('n_starts must be at least one')
+
+        if self.snapshots is not None and (
+                min(self.snapshots) < 1 or
+                max(self.snapshots) > self.iteration):
+            raise ValueError('snapshots must be between 1 and iteration')
+
+        if self.checkpoint is not None and self.n_starts > 1:
+            raise ValueError('checkpoint requires a single start')
+
+        if (self.memory_limit is not None and
+                self._peak_memory(X_sparse) > self.memory_limit * 2 ** 20):
+            raise ValueError('projected memory exceeds memory_limit')
+
         if self.rank * 10 > np.min(X_sparse.shape):
             warnings.warn(
                 'Insufficient samples, must have rank*10 samples in the table')
 
+        init = self.init
+        if warm_start is not None:
+            init = self._warm_start(warm_start, X_sparse)
+
         # return solved matrix
-        U, s_, V, _ = optspace(X_sparse, r=self.rank,
-                               niter=self.iteration, tol=self.tol)
-        solution = U.dot(s_).dot(V.T)
+        if self.n_starts > 1:
+            # independent seeded starts, the input is shared
+            # read-only by the processes of the pool
+            seeds = check_random_state(self.random_state).randint(
+                np.iinfo(np.int32).max, size=self.n_starts)
+            starts = map_shared(_start, list(seeds),
+                                (self, X_sparse, init), self.n_jobs)
+            final = [_last_distortion(start[3]) for start in starts]
+            self.start_diagnostics = pd.DataFrame(
+                {'seed': seeds, 'distortion': final,
+                 'iterations': [max(np.count_nonzero(start[3]) - 1, 0)
+                                for start in starts]})
+            U, s_, V, dist, path, status, rescal_param = starts[
+                int(np.argmin(final))]
+        else:
+            U, s_, V, dist, path, status, rescal_param = self._solve(
+                X_sparse, init, self.random_state, self.n_jobs)
+        self.path = path
+        self.status = status
+        self.distortion_history = dist
+        self.rescal_param = rescal_param
         explained_variance_ratio_ = np.diag(s_) / np.diag(s_).sum()
         self.eigenvalues = np.diag(s_)
         self.explained_variance_ratio = list(explained_variance_ratio_)[::-1]
-        self.distance = distance.cdist(U, U)
-        self.solution = solution
         self.feature_weights = V
         self.sample_weights = U
         self.s = s_
 
-    def fit_transform(self, X):
+    def _solve(self, X_sparse, init, random_state, n_jobs):
+        """
+        one OptSpace run from init, its snapshots,
+        status and the rescaling of the input
+        """
+
+        path, best, previous, status = {}, [], [], ['iteration']
+        start = time.time()
+
+        resume, scaling = None, []
+        if self.checkpoint is not None and os.path.exists(self.checkpoint):
+            resume = _load_checkpoint(self.checkpoint)
+            scaling = [float(resume['rescal_param'])]
+            # the anytime state of the run, the
+            # time budget counts the time before
+            if 'best_dist' in resume:
+                best[:] = [resume['best_X'], resume['best_S'],
+                           resume['best_Y'], float(resume['best_dist'])]
+                previous[:] = [float(resume['previous'])]
+                start -= float(resume['elapsed'])
+            if int(resume['iteration']) + 1 > self.iteration:
+                raise ValueError('checkpoint is of a run past iteration')
+            if 'status' in resume:
+                status[0] = str(resume['status'])
+
+        def callback(k, X, S, Y, dist):
+            if self.snapshots is not None and k in self.snapshots:
+                path[k] = Snapshot(k, X, S, Y, dist)
+            if not best or dist < best[3]:
+                best[:] = [X, S, Y, dist]
+            if (self.rtol is not None and previous and
+                    previous[0] - dist < self.rtol * previous[0]):
+                status[0] = 'rtol'
+            previous[:] = [dist]
+            if (self.time_budget is not None and
+                    time.time() - start > self.time_budget):
+                status[0] = 'time_budget'
+            return status[0] != 'iteration'
+
+        def checkpoint(state):
+            scaling[:] = [float(state['rescal_param'])]
+            if (self.checkpoint is not None and
+                    state['iteration'] % self.checkpoint_every == 0):
+                # with the best iterate and the last distortion
+                # for the rtol and time_budget of a resumed run
+                state = dict(state, best_X=best[0], best_S=best[1],
+                             best_Y=best[2], best_dist=best[3],
+                             previous=previous[0],
+                             elapsed=time.time() - start,
+                             status=status[0], niter=self.iteration)
+                _save_checkpoint(self.checkpoint, state)
+
+        if status[0] != 'iteration':
+            # the saved run had stopped, its result as it was
+            U, s_, V, _ = best
+            dist = np.zeros(self.iteration + 1)
+            k = min(len(resume['dist']), self.iteration + 1)
+            dist[:k] = resume['dist'][:k]
+        elif (issparse(X_sparse) or isinstance(X_sparse, CSRStore)
+                or n_jobs != 1):
+            # the row-block parallel engine works on the observed entries
+            if isinstance(X_sparse, np.ndarray):
+                X_sparse = coo_matrix(np.nan_to_num(X_sparse, nan=0))
+            U, s_, V, dist = optspace_sparse(
+                X_sparse, r=self.rank, niter=self.iteration, tol=self.tol,
+                solver=self.solver, dtype=self.dtype,
+                block_size=self.block_size, n_jobs=n_jobs, init=init,
+                random_state=random_state, callback=callback,
+                checkpoint=checkpoint, resume=resume)
+        else:
+            U, s_, V, dist = optspace(
+                X_sparse, r=self.rank, niter=self.iteration, tol=self.tol,
+                solver=self.solver, dtype=self.dtype, init=init,
+                random_state=random_state, callback=callback,
+                checkpoint=checkpoint, resume=resume)
+        # the callback tracks the last distortion, a
+        # resumed run that had converged makes no call
+        final = previous[0] if previous else _last_distortion(dist)
+        if status[0] == 'iteration' and final < self.tol:
+            status[0] = 'tol'
+        if (self.time_budget is not None or self.rtol is not None) and best:
+            # anytime run, keep the best iterate reached
+            U, s_, V, final = best
+        if self.snapshots is None:
+            path = None
+        else:
+            # when the run stopped early the
+            # later snapshots are the final solution
+            for k in self.snapshots:
+                if k not in path:
+                    path[k] = Snapshot(k, U, s_, V, final)
+            path = dict(sorted(path.items()))
+        return U, s_, V, dist, path, status[0], scaling[0]
+
+    def _peak_memory(self, X_sparse):
+        """ approximate peak memory of the fit of X_sparse in bytes """
+
+        n, m = X_sparse.shape
+        r = self.rank
+        itemsize = np.dtype(self.dtype).itemsize
+        n_jobs = self.n_jobs
+        if n_jobs == -1:
+            n_jobs = multiprocessing.cpu_count()
+        # the factors and their updates
+        peak = 8 * (n + m) * r * itemsize
+        if isinstance(X_sparse, CSRStore):
+            # only the blocks in flight are in memory
+            nnz = X_sparse.nnz * min(1, 2 * n_jobs * self.block_size / n)
+            peak += nnz * (2 * r + 4) * itemsize
+        elif issparse(X_sparse):
+            # the observed entries and the per-entry kernels
+            peak += X_sparse.nnz * ((2 * r + 5) * itemsize + 8)
+        elif n_jobs != 1:
+            # as above, from a dense copy of the input
+            peak += n * m * itemsize
+            peak += np.count_nonzero(X_sparse) * ((2 * r + 5) * itemsize + 8)
+        else:
+            # the dense copy, mask, residual and temporaries
+            peak += n * m * (5 * itemsize + 1)
+        if self.n_starts > 1:
+            peak *= max(1, min(n_jobs, self.n_starts))
+        return peak
+
+    def _warm_start(self, init, X_sparse):
+        """
+        The factors (U, s, V) of init aligned
+        to the samples and features of X_sparse
+        """
+
+        if isinstance(init, OptSpace):
+            U = _frame(init.sample_weights, init.sample_ids)
+            V = _frame(init.feature_weights, init.feature_ids)
+            s_ = init.s
+        else:
+            U, s_, V = init
+        s_ = np.asarray(s_, dtype=np.float64)
+        if s_.ndim == 1:
+            s_ = np.diag(s_)
+        if s_.shape != (self.rank, self.rank):
+            raise ValueError('init must be of the same rank')
+
+        U, new_samples = _align(U, self.sample_ids, X_sparse.shape[0])
+        V, new_features = _align(V, self.feature_ids, X_sparse.shape[1])
+        if new_samples.all() and new_features.all():
+            raise ValueError('init shares no samples or features with X')
+
+        # fold in the new samples from the known features
+        # and then the new features from all the samples
+        M_E = observed_entries(X_sparse, block_size=self.block_size)
+        if new_samples.any():
+            U[new_samples] = fold_in(M_E, V, s_, axis=0)[new_samples]
+        if new_features.any():
+            V[new_features] = fold_in(M_E, U, s_, axis=1)[new_features]
+        return U, s_, V
+
+    def transform(self, X=None):
+        """
+        Projects new samples onto the fitted loadings.
+        Each sample is fit by least squares against the
+        fixed feature loadings and singular values on
+        its observed features only (fold-in), the fitted
+        samples and loadings are left unchanged.
+
+        X: rclr preprocessed new samples of shape (K,N) in any
+        of the input types of fit. When X and the fit both have
+        feature IDs the features are aligned by ID and features
+        unknown to the fit are ignored.
+
+        Returns the "Sample Loadings" of the fit
+        if X is None, otherwise those of X of shape (K,rank)
+        """
+
+        if X is None:
+            return self.sample_weights
+        X = self._fit_features(X)
+        M_E = observed_entries(X, block_size=self.block_size)
+        return fold_in(M_E, self.feature_weights, self.s)
+
+    def save(self, path, centering=None):
+        """
+        Saves the fitted model to the directory path
+
+        The factors, the distortion history and the centering
+        are uncompressed .npy files that OptSpace.load
+        memory-maps, the fit parameters, status and rescaling
+        are in model.json and the IDs in text files.
+
+        centering: numpy.ndarray, optional : Default is None
+        The rclr centering of the samples of the fit
+        (rclr.centering), kept with the model.
+        """
+        os.makedirs(path, exist_ok=True)
+        if centering is not None:
+            self.centering = centering
+        for name in _ARRAYS:
+            if getattr(self, name, None) is not None:
+                np.save(os.path.join(path, name + '.npy'),
+                        np.asarray(getattr(self, name)))
+        for name in ['sample_ids', 'feature_ids']:
+            if getattr(self, name, None) is not None:
+                _write_ids(os.path.join(path, name + '.txt'),
+                           getattr(self, name))
+        params = {name: getattr(self, name) for name in _PARAMS}
+        params['dtype'] = np.dtype(self.dtype).str
+        if not isinstance(self.random_state, (int, np.integer)):
+            params['random_state'] = None
+        with open(os.path.join(path, 'model.json'), 'w') as f:
+            json.dump({'params': params,
+                       'status': getattr(self, 'status', None),
+                       'rescal_param': getattr(self, 'rescal_param', None),
+                       'explained_variance_ratio': [
+                           float(v) for v in getattr(
+                               self, 'explained_variance_ratio', [])]},
+                      f, default=_json_default)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        A fitted model saved by OptSpace.save
+
+        mmap_mode: str, optional : Default is 'r'
+        The numpy.load memory-map mode of the arrays, None
+        reads them into memory. Memory-mapped loading is
+        zero-copy so it does not grow with the model.
+
+        Raises
+        ------
+        ValueError
+
+        Raises an error if the path is not a saved model
+            `ValueError: path is not a saved OptSpace model`.
+        """
+        meta_path = os.path.join(path, 'model.json')
+        if not os.path.exists(meta_path):
+            raise ValueError('path is not a saved OptSpace model')
+        with open(meta_path) as f:
+            meta = json.load(f)
+        params = meta['params']
+        params['dtype'] = np.dtype(params['dtype'])
+        opt = cls(**params)
+        for name in _ARRAYS:
+            array_path = os.path.join(path, name + '.npy')
+            setattr(opt, name, np.load(array_path, mmap_mode=mmap_mode)
+                    if os.path.exists(array_path) else None)
+        for name in ['sample_ids', 'feature_ids']:
+            ids_path = os.path.join(path, name + '.txt')
+            setattr(opt, name, _read_ids(ids_path)
+                    if os.path.exists(ids_path) else None)
+        if opt.s is not None:
+            opt.eigenvalues = np.diag(opt.s)
+        opt.explained_variance_ratio = meta['explained_variance_ratio']
+        opt.status = meta['status']
+        opt.rescal_param = meta['rescal_param']
+        return opt
+
+    @property
+    def distance(self):
+        return distance.cdist(self.sample_weights, self.sample_weights)
+
+    @property
+    def solution(self):
+        return self.sample_weights.dot(self.s).dot(self.feature_weights.T)
+
+    def solution_blocks(self, block_size=None):
+        """
+        Iterates over the solution in blocks of rows
+
+        block_size: int, optional : Default is None
+        The number of samples of each block,
+        the block_size of the fit if None.
+
+        Yields
+        ------
+        start: int - the first sample of the block
+
+        numpy.ndarray - the rows of the solution
+        of the block. Of shape (block_size,N)
+        """
+        if block_size is None:
+            block_size = self.block_size
+        US = self.sample_weights.dot(self.s)
+        for start in range(0, US.shape[0], block_size):
+            yield start, US[start:start + block_size].dot(
+                self.feature_weights.T)
+
+    def predict(self, sample_ids=None, feature_ids=None, paired=False):
+        """
+        Entries of the solution, evaluated from the factors
+
+        sample_ids, feature_ids: list, optional : Default is None
+        The IDs of the samples and features of the fit (or
+        their positions when it was fit without IDs), all
+        of them if None.
+
+        paired: bool, optional : Default is False
+        Evaluate only the entries (sample_ids[k], feature_ids[k])
+        instead of every sample and feature.
+
+        Returns
+        -------
+        pandas.DataFrame - the solution of sample_ids by
+        feature_ids, or numpy.ndarray of the paired entries
+
+        Raises
+        ------
+        ValueError
+
+        Raises an error if an ID is not one of the fit
+            `ValueError: sample_ids must be samples of the fit`.
+            `ValueError: feature_ids must be features of the fit`.
+        """
+        rows = _positions(sample_ids, self.sample_ids,
+                          self.sample_weights.shape[0], 'sample')
+        cols = _positions(feature_ids, self.feature_ids,
+                          self.feature_weights.shape[0], 'feature')
+        US = self.sample_weights[rows].dot(self.s)
+        V = self.feature_weights[cols]
+        if paired:
+            return np.einsum('ij,ij->i', US, V)
+        if sample_ids is None:
+            sample_ids = rows if self.sample_ids is None else self.sample_ids
+        if feature_ids is None:
+            feature_ids = (cols if self.feature_ids is None
+                           else self.feature_ids)
+        return pd.DataFrame(US.dot(V.T), index=sample_ids,
+                            columns=feature_ids)
+
+    def sample_index(self, leafsize=16):
+        """
+        A deicode.neighbors.SampleIndex over the sample loadings
+        for nearest-neighbor queries without the distance matrix
+        """
+        return SampleIndex(self.sample_weights, self.sample_ids,
+                           leafsize=leafsize)
+
+    def rotate(self):
+        """
+        Rotates the loadings to the SVD of the solution, so s is
+        diagonal (in the ascending order of the fit) and the
+        eigenvalues are the whole of it. The solution and the
+        distances are unchanged. Returns self.
+        """
+        A, sigma, Bt = np.linalg.svd(self.s)
+        A, sigma, B = A[:, ::-1], sigma[::-1], Bt[::-1].T
+        self.sample_weights = self.sample_weights.dot(A)
+        self.feature_weights = self.feature_weights.dot(B)
+        self.s = np.diag(sigma).astype(self.s.dtype)
+        self.eigenvalues = sigma
+        self.explained_variance_ratio = list(sigma / sigma.sum())[::-1]
+        return self
+
+    def partial_fit(self, X):
+        """
+        Online update of the feature loadings and singular
+        values from a mini-batch X of rclr preprocessed samples
+        (of any of the input types of fit).
+
+        The samples of the batch are folded in (see transform)
+        and the feature factor is then the least squares
+        solution of the masked objective over all the samples
+        seen. Only its (N,rank,rank) sufficient statistics
+        are kept, so the memory does not grow with the number
+        of samples. The first batch is initialized by init.
+
+        Features new to a batch (by ID) are added to the fit.
+        The sample loadings of any batch are given by transform.
+
+        Raises
+        ------
+        ValueError
+
+        Raises an error if the first batch has at most rank samples
+            `ValueError: the first partial_fit batch needs more
+            than rank samples`.
+        """
+
+        X_, _, ids = _ids(X)
+        if getattr(self, 'feature_system', None) is None:
+            if X_.shape[0] <= self.rank:
+                # the batch initializes the rank singular vectors
+                raise ValueError('the first partial_fit batch needs more '
+                                 'than rank samples')
+            m = X_.shape[1]
+            self.feature_ids = ids
+            self.feature_factor = None
+            self.feature_system = (np.zeros((m, self.rank, self.rank)),
+                                   np.zeros((m, self.rank)))
+            self.n_samples_seen = 0
+        elif ids is not None and self.feature_ids is not None:
+            known = set(self.feature_ids)
+            new_ids = [id_ for id_ in pd.Index(ids).unique()
+                       if id_ not in known]
+            if len(new_ids):
+                # new features start unobserved
+                A, C = self.feature_system
+                k = len(new_ids)
+                self.feature_system = (
+                    np.concatenate([A, np.zeros((k,) + A.shape[1:])]),
+                    np.concatenate([C, np.zeros((k, self.rank))]))
+                self.feature_factor = np.concatenate(
+                    [self.feature_factor, np.zeros((k, self.rank))])
+                self.feature_ids = list(self.feature_ids) + new_ids
+        X = self._fit_features(X, len(self.feature_system[1]))
+        M_E = observed_entries(X, block_size=self.block_size)
+        if self.feature_factor is None:
+            U, s_, Vt = svd_init(M_E, self.rank, init=self.init,
+                                 random_state=self.random_state)
+            self.feature_factor = Vt.T * s_
+
+        # batch sample loadings on the current feature factor
+        # and the feature factor on all the samples seen
+        eye = np.eye(self.rank)
+        U = fold_in(M_E, self.feature_factor, eye)
+        A, C = fold_in_system(M_E, U, eye, axis=1)
+        self.feature_system = (self.feature_system[0] + A,
+                               self.feature_system[1] + C)
+        self.feature_factor = solve_rows(*self.feature_system)
+        self.n_samples_seen += M_E.shape[0]
+
+        # the loadings are reported in the basis of the
+        # singular vectors of the feature factor
+        V, s_, _ = np.linalg.svd(self.feature_factor, full_matrices=False)
+        s_, V = s_[::-1], V[:, ::-1]
+        self.feature_weights = V.astype(self.dtype)
+        self.s = np.diag(s_).astype(self.dtype)
+        self.eigenvalues = s_
+        self.explained_variance_ratio = list(s_ / s_.sum())[::-1]
+        return self
+
+    def _fit_features(self, X, m=None):
+        """ X with the columns of the (m) fitted features """
+
+        X, _, ids = _ids(X)
+        if isinstance(X, CSRStore):
+            X = X.tocsr()
+        elif not issparse(X):
+            X = np.asarray(X, dtype=np.float64)
+        if m is None:
+            m = len(self.feature_weights)
+        if ids is None or self.feature_ids is None:
+            if X.shape[1] != m:
+                raise ValueError('X must have the features of the fit')
+            return X
+        index = pd.Index(self.feature_ids).get_indexer(ids)
+        if (index < 0).all():
+            raise ValueError('X shares no features with the fit')
+        if issparse(X):
+            X = X.tocoo()
+            keep = index[X.col] >= 0
+            return coo_matrix((X.data[keep],
+                               (X.row[keep], index[X.col[keep]])),
+                              shape=(X.shape[0], m))
+        X_ = np.full((X.shape[0], m), np.nan)
+        X_[:, index[index >= 0]] = X[:, index >= 0]
+        return X_
+
+    def fit_transform(self, X, init=None):
         """
         Returns the final SVD of
 
@@ -192,7 +864,152 @@ class OptSpace(_BaseImpute):
         having right singular vectors as rows. Of shape (N,rank)
 
         """
-        X_sparse = X.copy().astype(np.float64)
-        self.X_sparse = X_sparse
-        self._fit()
+        self.fit(X, init=init)
         return self.sample_weights, self.s, self.feature_weights
+
+
+class Snapshot(object):
+
+    def __init__(self, iteration, sample_weights, s, feature_weights,
+                 distortion):
+        """
+        The OptSpace solution after a number of iterations.
+        The solution and distance are only computed
+        when they are accessed.
+        """
+        self.iteration = iteration
+        self.sample_weights = sample_weights
+        self.s = s
+        self.feature_weights = feature_weights
+        self.distortion = distortion
+
+    @property
+    def eigenvalues(self):
+        return np.diag(self.s)
+
+    @property
+    def solution(self):
+        return self.sample_weights.dot(self.s).dot(self.feature_weights.T)
+
+    @property
+    def distance(self):
+        return distance.cdist(self.sample_weights, self.sample_weights)
+
+
+def _start(shared, seed):
+    """ one of the seeded starts of OptSpace """
+
+    opt, X_sparse, init = shared
+    return opt._solve(X_sparse, init, seed, 1)
+
+
+# the fit parameters and arrays of a saved model
+_PARAMS = ['rank', 'iteration', 'tol', 'solver', 'dtype', 'block_size',
+           'n_jobs', 'init', 'random_state', 'n_starts', 'snapshots',
+           'checkpoint', 'checkpoint_every', 'time_budget', 'rtol',
+           'memory_limit']
+_ARRAYS = ['sample_weights', 's', 'feature_weights',
+           'distortion_history', 'centering']
+
+
+def _last_distortion(dist):
+    """ the last distortion evaluated by a run """
+
+    # the entries after an early stop stay 0 (as does dist[1])
+    evaluated = np.flatnonzero(dist)
+    return dist[evaluated[-1]] if len(evaluated) else dist[-1]
+
+
+def _json_default(value):
+    """ numpy scalars of the parameters as python numbers """
+
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def _positions(ids, fit_ids, n, axis):
+    """ the rows of ids in the fit, all of them if ids is None """
+
+    if ids is None:
+        return np.arange(n)
+    if fit_ids is None:
+        positions = np.asarray(ids, dtype=np.intp)
+        missing = (positions < 0) | (positions >= n)
+    else:
+        positions = pd.Index(fit_ids).get_indexer(ids)
+        missing = positions == -1
+    if missing.any():
+        raise ValueError('%s_ids must be %ss of the fit' % (axis, axis))
+    return positions
+
+
+def _save_checkpoint(path, state):
+    """ writes the state of a run, replacing path atomically """
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **state)
+    os.replace(tmp, path)
+
+
+def _load_checkpoint(path):
+    """ the state of a run saved by _save_checkpoint """
+
+    with np.load(path) as state:
+        return {key: state[key] for key in state.files}
+
+
+def _ids(X):
+    """
+    Parameters
+    ----------
+    X
+
+    Returns
+    -------
+    X (as (samples, features) for a biom.Table) and
+    its sample and feature IDs, None if X has no IDs
+    """
+    if isinstance(X, Table):
+        # biom tables are stored as (features, samples)
+        return (X.matrix_data.T, list(X.ids()),
+                list(X.ids('observation')))
+    if isinstance(X, pd.DataFrame):
+        return X, list(X.index), list(X.columns)
+    if isinstance(X, CSRStore):
+        return X, list(X.sample_ids), list(X.feature_ids)
+    return X, None, None
+
+
+def _frame(weights, ids):
+    """ weights indexed by ids (if any) """
+
+    if ids is None:
+        return weights
+    return pd.DataFrame(weights, index=ids)
+
+
+def _align(weights, ids, n):
+    """
+    Parameters
+    ----------
+    weights, ids, n
+
+    weights is a numpy.ndarray or a pandas.DataFrame
+    indexed by ID, ids the n IDs of the input (or None).
+
+    Returns
+    -------
+    the rows of weights in the order of ids, rows of IDs
+    absent from weights are zero, and a mask of those rows.
+    """
+    if isinstance(weights, pd.DataFrame) and ids is not None:
+        new = ~pd.Index(ids).isin(weights.index)
+        weights = weights.reindex(ids).fillna(0).values
+        return weights.astype(np.float64), new
+    weights = np.array(weights, dtype=np.float64)
+    if len(weights) != n:
+        raise ValueError('init must match the shape of X'
+                         ' when it is not indexed by IDs')
+    return weights, np.zeros(n, dtype=bool)
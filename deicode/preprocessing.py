@@ -1,6 +1,10 @@
+import h5py
 import numpy as np
+from biom import Table
+from scipy.sparse import csr_matrix, issparse, save_npz
 from skbio.stats.composition import closure
 from .base import _BaseTransform
+from .store import CSRStore
 import warnings
 np.seterr(all='ignore')
 # need to ignore log of zero warning
@@ -8,7 +12,7 @@ np.seterr(all='ignore')
 
 class rclr(_BaseTransform):
 
-    def __init__(self):
+    def __init__(self, dtype=np.float64):
         """
 
         The rclr procedure first log transform
@@ -27,9 +31,22 @@ class rclr(_BaseTransform):
         N = Features (i.e. OTUs, metabolites)
         M = Samples
 
+        X may also be a scipy.sparse matrix of shape (M,N)
+        or a biom.Table of shape (N,M). The rclr is then
+        computed from the nonzero entries alone and returned
+        as a scipy.sparse.csr_matrix of shape (M,N) where only
+        the stored entries are observed (instead of nans).
+
+        dtype: numpy.dtype, optional : Default is np.float64
+        The floating point precision of the transform.
+
         Returns
         -------
 
+        centering: numpy.ndarray - The mean log proportion of
+        the nonzero entries of each sample (M,) that the rclr
+        subtracts, nan for samples without any.
+
         Raises
         ------
         ValueError
@@ -65,12 +82,24 @@ class rclr(_BaseTransform):
         >>> data=np.array([[3, 3, 0], [0, 4, 2], [3, 0, 1]])
         >>> table_rclr=rclr().fit_transform(data)
 
+        scipy.sparse.csr_matrix - sparse counts (samples,features)
+
+        >>> from scipy.sparse import csr_matrix
+        >>> table_rclr=rclr().fit_transform(csr_matrix(data))
+
         """
+        self.dtype = dtype
         return
 
     def fit(self, X):
         """  fits and calc. the rclr """
-        X_ = np.array(X.copy()).astype(np.float64)
+        if isinstance(X, Table):
+            # biom tables are stored as (features, samples)
+            X = X.matrix_data.T
+        if issparse(X):
+            X_ = csr_matrix(X, dtype=self.dtype, copy=True)
+        else:
+            X_ = np.array(X, dtype=self.dtype)
         self.X_ = X_
         self._fit()
         return self
@@ -78,7 +107,11 @@ class rclr(_BaseTransform):
     def _fit(self):
         """ fits and calc. the rclr  """
 
-        X_ = self.X_.copy().astype(float)
+        X_ = self.X_
+
+        if issparse(X_):
+            self._fit_sparse()
+            return
 
         if (X_ < 0).any():
             raise ValueError('Array Contains Negative Values')
@@ -93,45 +126,334 @@ class rclr(_BaseTransform):
             warnings.warn("Data-table contains no zeros.", RuntimeWarning)
 
         X_log = np.log(closure(np.array(X_)))
-        log_mask = np.array(
-            [True] * X_log.shape[0] * X_log.shape[1]
-        ).reshape(X_log.shape)
-        log_mask[np.isfinite(X_log)] = False
+        log_mask = ~np.isfinite(X_log)
         # sum of rows (features)
         m = np.ma.array(X_log, mask=log_mask)
         gm = m.mean(axis=-1, keepdims=True)
+        self.centering = np.ma.filled(gm, np.nan).ravel()
         m = (m - gm).squeeze().data
         m[~np.isfinite(X_log)] = np.nan
-        self.X_sp = m
+        self.X_sp = m.astype(self.dtype, copy=False)
+
+    def _fit_sparse(self):
+        """ calc. the rclr from the nonzero entries of a csr_matrix  """
+
+        X_ = self.X_
+        X_.eliminate_zeros()
+        data = X_.data
+
+        if (data < 0).any():
+            raise ValueError('Array Contains Negative Values')
+
+        if np.count_nonzero(np.isinf(data)) != 0:
+            raise ValueError('Data-table contains either np.inf or -np.inf')
+
+        if np.count_nonzero(np.isnan(data)) != 0:
+            raise ValueError('Data-table contains nans')
+
+        if X_.nnz == 0:
+            warnings.warn("Data-table contains no zeros.", RuntimeWarning)
+
+        # the mean log of the closure is that of
+        # the counts less the log of the depth
+        depth = np.asarray(X_.sum(axis=1)).ravel()
+        _, gm = _rclr_csr(data, X_.indptr)
+        with np.errstate(divide='ignore'):
+            self.centering = gm - np.log(depth)
+        self.centering[depth == 0] = np.nan
+        self.X_sp = X_
 
     def fit_transform(self, X):
         """ directly returns the rclr transform  """
-        X_ = np.array(X.copy()).astype(np.float64)
-        self.X_ = X_
-        self._fit()
+        self.fit(X)
         return self.X_sp
 
 
 class inverse_rclr(_BaseTransform):
 
-    def __init__(self):
+    def __init__(self, dtype=np.float64):
+        self.dtype = dtype
         return
 
     def fit(self, X):
         """ TODO """
-        X_ = np.array(X.copy()).astype(np.float64)
+        X_ = np.array(X, dtype=self.dtype)
         self.X_ = X_
         self._fit()
         return self
 
     def _fit(self):
         """ TODO """
-        X_sp = np.exp(np.array(self.X_.copy()))
-        self.X_sp = closure(X_sp).astype(np.float64)
+        self.X_sp = _closed_exp(self.X_.copy())
 
     def fit_transform(self, X):
         """ TODO """
-        X_ = np.array(X.copy()).astype(np.float64)
-        self.X_ = X_
-        self._fit()
+        self.fit(X)
         return self.X_sp
+
+
+def inverse_rclr_blocks(X, output=None, top_k=None, block_size=1000,
+                        dtype=np.float64):
+    """
+
+    Streaming inverse rclr of a reconstructed table. Blocks of
+    samples are taken from the low-rank factors of an OptSpace
+    fit (or read from an on-disk matrix), exponentiated and
+    closed one at a time, so peak memory is bounded by a block
+    of samples plus the output (or only the top_k proportions
+    of each sample).
+
+    Parameters
+    ----------
+
+    X: OptSpace or numpy.ndarray - a fit whose solution is
+    inverted, or a clr table of shape (M,N) e.g. memory-mapped
+    with np.load(path, mmap_mode='r')
+
+    output: str, optional : Default is None
+    The file the compositions are written to, a .npy file
+    (memory-mapped) or with top_k a scipy.sparse .npz file.
+
+    top_k: int, optional : Default is None
+    Keep only the top_k largest proportions of each sample
+    (of the composition over all the features, they are not
+    closed again) as a sparse matrix.
+
+    block_size: int, optional : Default is 1000
+    The number of samples inverted at a time.
+
+    dtype: numpy.dtype, optional : Default is np.float64
+    The floating point precision of the compositions.
+
+    Returns
+    -------
+
+    numpy.ndarray - the compositions of shape (M,N),
+    memory-mapped from output if given. With top_k a
+    scipy.sparse.csr_matrix of top_k entries per sample.
+
+    Raises
+    ------
+    ValueError
+
+    Raises an error if top_k is more than the number of features
+        `ValueError: top_k must be between 1 and the number
+        of features`.
+
+    Examples
+    --------
+
+    >>> from deicode.preprocessing import inverse_rclr_blocks
+    >>> opt = OptSpace(rank=3).fit(rclr().fit_transform(table))
+    >>> top = inverse_rclr_blocks(opt, 'top.npz', top_k=100)
+
+    """
+
+    if hasattr(X, 'solution_blocks'):
+        n, m = X.sample_weights.shape[0], X.feature_weights.shape[0]
+        blocks = X.solution_blocks(block_size)
+    else:
+        n, m = X.shape
+        blocks = ((start, X[start:start + block_size])
+                  for start in range(0, n, block_size))
+
+    if top_k is None:
+        if output is None:
+            out = np.empty((n, m), dtype=dtype)
+        else:
+            out = np.lib.format.open_memmap(output, mode='w+',
+                                            dtype=dtype, shape=(n, m))
+        for start, block in blocks:
+            block = np.array(block, dtype=dtype)
+            out[start:start + len(block)] = _closed_exp(block)
+        if output is None:
+            return out
+        out.flush()
+        del out
+        return np.load(output, mmap_mode='r')
+
+    if not 0 < top_k <= m:
+        raise ValueError('top_k must be between 1 and the number '
+                         'of features')
+    data = np.empty(n * top_k, dtype=dtype)
+    indices = np.empty(n * top_k, dtype=np.int64)
+    for start, block in blocks:
+        block = _closed_exp(np.array(block, dtype=dtype))
+        top = np.argpartition(-block, top_k - 1, axis=1)[:, :top_k]
+        top.sort(axis=1)
+        lo, hi = start * top_k, (start + len(block)) * top_k
+        indices[lo:hi] = top.ravel()
+        data[lo:hi] = np.take_along_axis(block, top, axis=1).ravel()
+    out = csr_matrix((data, indices, np.arange(0, n * top_k + 1, top_k)),
+                     shape=(n, m))
+    if output is not None:
+        save_npz(output, out, compressed=False)
+    return out
+
+
+def _closed_exp(X):
+    """ closure of the exp of the rows of X, in place """
+
+    # the closure cancels the row maximum, taking it
+    # out first keeps the exp from overflowing
+    X -= X.max(axis=1, keepdims=True)
+    np.exp(X, out=X)
+    X /= X.sum(axis=1, keepdims=True)
+    return X
+
+
+def _rclr_csr(data, indptr):
+    """
+    rclr of the nonzero entries of a csr matrix, in place on
+    data, and the mean log of the nonzero entries of each row
+    """
+
+    # the closure cancels in the centered log so the
+    # per-sample geometric mean of the nonzeros is taken
+    # directly on the log of the counts
+    np.log(data, out=data)
+    counts = np.diff(indptr)
+    observed = counts > 0
+    gm = np.zeros(len(counts), dtype=data.dtype)
+    gm[observed] = np.add.reduceat(data, indptr[:-1][observed])
+    gm[observed] /= counts[observed]
+    data -= np.repeat(gm, counts)
+    return data, gm
+
+
+def rclr_hdf5(biom_path, output_dir, min_sample_count=0,
+              min_feature_count=0, block_size=1000, dtype=np.float64):
+    """
+
+    Streaming rclr of a biom (HDF5, format 2.1) table on disk.
+    Blocks of samples are read from the file one at a time to
+    apply the sample depth and feature count filters and the rclr,
+    the result is written to a memory-mapped CSRStore.
+
+    Parameters
+    ----------
+
+    biom_path: str - path to the biom HDF5 table of counts
+
+    output_dir: str - directory the CSRStore is written to
+
+    min_sample_count: int, optional : Default is 0
+    Samples with a sum of counts not greater
+    than this are removed.
+
+    min_feature_count: int, optional : Default is 0
+    Features with a sum of counts (across the samples
+    that pass the sample filter) not greater than
+    this are removed.
+
+    block_size: int, optional : Default is 1000
+    The number of samples read at a time, peak memory is
+    bounded by the entries of block_size samples plus
+    vectors of the number of samples and features.
+
+    dtype: numpy.dtype, optional : Default is np.float64
+    The floating point precision of the stored rclr values.
+
+    Returns
+    -------
+
+    deicode.store.CSRStore - the rclr of shape (M,N), only
+    the nonzero counts are stored, with the sample and
+    feature IDs that passed the filters.
+
+    Raises
+    ------
+    ValueError
+
+    Raises an error if values in the table are negative
+        `ValueError: Array Contains Negative Values`.
+
+    Raises an error if the table contains either np.inf, -np.inf or nans
+        `ValueError: Data-table contains either np.inf, -np.inf or nans`.
+
+    Examples
+    --------
+
+    >>> from deicode.preprocessing import rclr_hdf5
+    >>> from deicode.optspace import OptSpace
+    >>> store = rclr_hdf5('table.biom', 'rclr-store',
+    ...                   min_sample_count=500, min_feature_count=10)
+    >>> opt = OptSpace(rank=3).fit(store)
+
+    """
+
+    with h5py.File(biom_path, 'r') as f:
+        # sample/matrix is the table stored as csr (samples, features)
+        h5_data = f['sample/matrix/data']
+        h5_indices = f['sample/matrix/indices']
+        indptr = f['sample/matrix/indptr'][:]
+        sample_ids = [_decode(id_) for id_ in f['sample/ids'][:]]
+        feature_ids = [_decode(id_) for id_ in f['observation/ids'][:]]
+        n, m = len(sample_ids), len(feature_ids)
+
+        def blocks():
+            for start in range(0, n, block_size):
+                stop = min(n, start + block_size)
+                lo, hi = indptr[start], indptr[stop]
+                rows = np.repeat(np.arange(stop - start),
+                                 np.diff(indptr[start:stop + 1]))
+                yield start, stop, rows, h5_indices[lo:hi], h5_data[lo:hi]
+
+        # pass one: sample depth filter and feature sums
+        keep_samples = np.zeros(n, dtype=bool)
+        feature_sums = np.zeros(m)
+        for start, stop, rows, cols, data in blocks():
+            if (data < 0).any():
+                raise ValueError('Array Contains Negative Values')
+            if not np.isfinite(data).all():
+                raise ValueError('Data-table contains either'
+                                 ' np.inf, -np.inf or nans')
+            depth = np.bincount(rows, weights=data, minlength=stop - start)
+            keep = depth > min_sample_count
+            keep_samples[start:stop] = keep
+            feature_sums += np.bincount(cols[keep[rows]],
+                                        weights=data[keep[rows]],
+                                        minlength=m)
+        keep_features = feature_sums > min_feature_count
+        new_feature = np.cumsum(keep_features) - 1
+
+        # pass two: the number of entries kept in each sample
+        counts = np.zeros(n, dtype=np.int64)
+        for start, stop, rows, cols, data in blocks():
+            keep = keep_features[cols] & (data != 0)
+            counts[start:stop] = np.bincount(rows[keep],
+                                             minlength=stop - start)
+        counts = counts[keep_samples]
+
+        store = CSRStore.create(output_dir,
+                                (int(keep_samples.sum()),
+                                 int(keep_features.sum())),
+                                int(counts.sum()), dtype,
+                                np.array(sample_ids)[keep_samples],
+                                np.array(feature_ids)[keep_features])
+        store.indptr[0] = 0
+        np.cumsum(counts, out=store.indptr[1:])
+
+        # pass three: rclr of each block written to the store
+        row = 0
+        for start, stop, rows, cols, data in blocks():
+            keep = keep_samples[start:stop][rows] & keep_features[cols] \
+                & (data != 0)
+            kept_rows = np.flatnonzero(keep_samples[start:stop])
+            if len(kept_rows) == 0:
+                continue
+            block_indptr = np.asarray(
+                store.indptr[row:row + len(kept_rows) + 1])
+            lo, hi = block_indptr[0], block_indptr[-1]
+            block_data = data[keep].astype(dtype)
+            _rclr_csr(block_data, block_indptr - lo)
+            store.data[lo:hi] = block_data
+            store.indices[lo:hi] = new_feature[cols[keep]]
+            row += len(kept_rows)
+
+    store.flush()
+    return CSRStore(output_dir)
+
+
+def _decode(id_):
+    return id_.decode('utf-8') if isinstance(id_, bytes) else str(id_)
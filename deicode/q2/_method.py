@@ -1,6 +1,8 @@
 import biom
 import skbio
+import numpy as np
 import pandas as pd
+from scipy.spatial import distance
 from deicode.optspace import OptSpace
 from deicode.preprocessing import rclr
 
@@ -9,7 +11,13 @@ def rpca(table: biom.Table,
          rank: int=3,
          min_sample_count: int=500,
          min_feature_count: int=10,
-         iterations: int=5) -> (
+         iterations: int=5,
+         dtype: str='float64',
+         n_jobs: int=1,
+         n_starts: int=1,
+         time_budget: float=None,
+         rtol: float=None,
+         memory_limit: float=None) -> (
          skbio.OrdinationResults,
          skbio.DistanceMatrix):
     """ Runs RPCA with an rclr preprocessing step"""
@@ -21,11 +29,21 @@ def rpca(table: biom.Table,
     table = table.T[table.sum() > min_feature_count].T
 
     # rclr preprocessing and OptSpace (RPCA)
+    dtype = np.dtype(dtype)
     opt = OptSpace(
         rank=rank,
-        iteration=iterations).fit(
-        rclr().fit_transform(
+        iteration=iterations,
+        dtype=dtype,
+        n_jobs=n_jobs,
+        n_starts=n_starts,
+        time_budget=time_budget,
+        rtol=rtol,
+        memory_limit=memory_limit).fit(
+        rclr(dtype=dtype).fit_transform(
             table.copy()))
+    # the biplot is of the SVD of the solution, its
+    # eigenvalues are then the whole of the fitted s
+    opt.rotate()
     rename_cols = {i - 1: 'PC' + str(i) for i in range(1, rank + 1)}
 
     # Feature Loadings
@@ -66,3 +84,50 @@ def rpca(table: biom.Table,
         opt.distance, ids=sample_loading.index)
 
     return ord_res, dist_res
+
+
+def rpca_transform(biplot: skbio.OrdinationResults,
+                   table: biom.Table,
+                   min_sample_count: int=0) -> (
+                   skbio.OrdinationResults,
+                   skbio.DistanceMatrix):
+    """ Projects new samples onto an existing RPCA biplot """
+
+    # filter sample to min depth
+    def sample_filter(val, id_, md): return sum(val) > min_sample_count
+    table = table.filter(sample_filter, axis='sample', inplace=False)
+    # only the new samples and the features of the biplot are used
+    new_samples = [id_ for id_ in table.ids()
+                   if id_ not in biplot.samples.index]
+    features = [id_ for id_ in table.ids('observation')
+                if id_ in biplot.features.index]
+    table = table.filter(new_samples, axis='sample', inplace=False)
+    table = table.filter(features, axis='observation', inplace=False)
+
+    # rclr preprocessing of the new samples
+    table_rclr = biom.Table(rclr().fit_transform(table).T,
+                            table.ids('observation'), table.ids())
+
+    # fold-in on the fixed feature loadings
+    opt = OptSpace(rank=biplot.features.shape[1])
+    opt.feature_weights = biplot.features.values
+    opt.feature_ids = list(biplot.features.index)
+    opt.s = np.diag(biplot.eigvals.values)
+    new_loading = pd.DataFrame(opt.transform(table_rclr),
+                               index=table.ids(),
+                               columns=biplot.samples.columns)
+    sample_loading = pd.concat([biplot.samples, new_loading])
+
+    ord_res = skbio.OrdinationResults(
+        biplot.short_method_name,
+        biplot.long_method_name,
+        biplot.eigvals.copy(),
+        samples=sample_loading.copy(),
+        features=biplot.features.copy(),
+        proportion_explained=biplot.proportion_explained.copy())
+    # save distance matrix
+    dist_res = skbio.stats.distance.DistanceMatrix(
+        distance.cdist(sample_loading, sample_loading),
+        ids=sample_loading.index)
+
+    return ord_res, dist_res
@@ -9,8 +9,8 @@
 import qiime2.plugin
 import qiime2.sdk
 from deicode import __version__
-from ._method import rpca
-from qiime2.plugin import (Properties, Int)
+from ._method import rpca, rpca_transform
+from qiime2.plugin import (Properties, Int, Float, Str, Choices)
 from q2_types.feature_table import FeatureTable, Frequency
 from q2_types.distance_matrix import DistanceMatrix
 from q2_types.ordination import PCoAResults
@@ -37,6 +37,12 @@ plugin.methods.register_function(
         'min_sample_count': Int,
         'min_feature_count': Int,
         'iterations': Int,
+        'dtype': Str % Choices(['float64', 'float32']),
+        'n_jobs': Int,
+        'n_starts': Int,
+        'time_budget': Float,
+        'rtol': Float,
+        'memory_limit': Float,
     },
     outputs=[
         ('biplot', PCoAResults % Properties("biplot")),
@@ -54,6 +60,22 @@ plugin.methods.register_function(
                               ' features across all samples'),
         'iterations': ('The number of iterations to optomize the solution'
                        ' (suggested to below 100, beware of overfitting)'),
+        'dtype': ('The floating point precision of the computation.'
+                  ' float32 halves the memory used at a small'
+                  ' loss of accuracy.'),
+        'n_jobs': ('The number of threads OptSpace is run on'
+                   ' (-1 uses all the cores).'),
+        'n_starts': ('The number of independent OptSpace starts, the'
+                     ' one with the lowest final distortion is kept.'
+                     ' The starts run in parallel on n_jobs processes.'),
+        'time_budget': ('The wall-clock time in seconds after which'
+                        ' OptSpace stops with the best solution so far.'),
+        'rtol': ('OptSpace stops once an iteration reduces the'
+                 ' distortion by less than this fraction.'),
+        'memory_limit': ('The memory in MB OptSpace may use, the run'
+                         ' is not started if its projected peak'
+                         ' exceeds it. This is an estimate checked'
+                         ' before the run, not a hard cap.'),
     },
     output_descriptions={
         'biplot': ('A biplot of the (Robust Aitchison) RPCA feature loadings'),
@@ -66,3 +88,37 @@ plugin.methods.register_function(
                  "loadings of the resulting SVD."),
     citations=[]
 )
+
+plugin.methods.register_function(
+    function=rpca_transform,
+    inputs={'biplot': PCoAResults % Properties("biplot"),
+            'table': FeatureTable[Frequency]},
+    parameters={
+        'min_sample_count': Int,
+    },
+    outputs=[
+        ('projected_biplot', PCoAResults % Properties("biplot")),
+        ('distance_matrix', DistanceMatrix)
+    ],
+    input_descriptions={
+        'biplot': 'A biplot from rpca.',
+        'table': 'Input table of counts of the new samples.',
+    },
+    parameter_descriptions={
+        'min_sample_count': ('Minimum sum cutoff of'
+                             ' sample across all features'),
+    },
+    output_descriptions={
+        'projected_biplot': ('The biplot with the new samples projected'
+                             ' onto its feature loadings'),
+        'distance_matrix': ('The Aitchison distance of'
+                            ' the sample loadings of the biplot.')
+    },
+    name='Project new samples onto a RPCA Biplot',
+    description=("Performs robust center log-ratio transform of "
+                 "the new samples and projects them onto the fixed "
+                 "feature loadings of the biplot by least squares on "
+                 "their observed features. The samples of the biplot "
+                 "are unchanged."),
+    citations=[]
+)
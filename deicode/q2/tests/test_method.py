@@ -1,9 +1,10 @@
 import unittest
 import numpy as np
+import numpy.testing as npt
 from biom import Table
 from skbio import OrdinationResults
 from skbio.stats.distance import DistanceMatrix
-from deicode.q2._method import rpca
+from deicode.q2._method import rpca, rpca_transform
 from simulations import build_block_model
 
 
@@ -31,6 +32,45 @@ class Testrpca(unittest.TestCase):
         self.assertTrue(any(np.isnan(ord_test.features)))
         self.assertTrue(any(np.isnan(ord_test.samples)))
 
+    def test_rpca_float32(self):
+        # float32 distances stay close to float64
+        _, dist_64 = rpca(table=self.test_table, dtype='float64')
+        _, dist_32 = rpca(table=self.test_table, dtype='float32')
+        err = (np.linalg.norm(dist_32.data - dist_64.data)
+               / np.linalg.norm(dist_64.data))
+        self.assertLess(err, 1e-3)
+        ord_32, dist_32 = rpca(table=self.test_table, rank=4,
+                               dtype='float32')
+        self.assertEqual(ord_32.samples.shape, (50, 4))
+        self.assertTrue(np.isfinite(dist_32.data).all())
+
+    def test_rpca_transform(self):
+        fit_ids = self.test_table.ids()[:40]
+        fit_table = self.test_table.filter(fit_ids, inplace=False)
+        ord_test, _ = rpca(table=fit_table)
+        ord_res, dist_res = rpca_transform(ord_test, self.test_table)
+        self.assertEqual(list(ord_res.samples.index),
+                         list(self.test_table.ids()))
+        npt.assert_array_equal(ord_res.samples.loc[fit_ids].values,
+                               ord_test.samples.values)
+        npt.assert_array_equal(ord_res.features.values,
+                               ord_test.features.values)
+        self.assertFalse(np.isnan(ord_res.samples.values).any())
+        self.assertEqual(dist_res.shape, (50, 50))
+
+    def test_rpca_transform_training(self):
+        # projecting the training samples (under new IDs) gives
+        # back their loadings, the fold-in of a converged fit
+        ord_test, _ = rpca(table=self.test_table, iterations=1000)
+        new_ids = ['new_' + id_ for id_ in self.test_table.ids()]
+        new_table = Table(self.test_table.matrix_data,
+                          self.test_table.ids('observation'), new_ids)
+        ord_res, _ = rpca_transform(ord_test, new_table)
+        exp = ord_test.samples.values
+        res = ord_res.samples.loc[['new_' + id_ for id_
+                                   in ord_test.samples.index]].values
+        npt.assert_allclose(res, exp, atol=5e-3 * np.abs(exp).max())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,54 @@
+import click
+import numpy as np
+import pandas as pd
+from skbio import OrdinationResults
+from deicode.neighbors import SampleIndex
+
+
+@click.command()
+@click.option('--in_ordination',
+              help='Input RPCA ordination (e.g. RPCA_Ordination.txt).')
+@click.option('--output', help='Output table of the neighbors (tsv).')
+@click.option(
+    '--query_ordination',
+    default=None,
+    help='Ordination of the query samples, e.g. projected with the'
+         ' q2 rpca-transform action. default=None (the samples of'
+         ' in_ordination, which are then not their own neighbors)')
+@click.option(
+    '--n_neighbors',
+    default=50,
+    help='The number of neighbors of each query. default=50')
+@click.option(
+    '--radius',
+    default=None,
+    type=float,
+    help='Return all the neighbors within this distance instead'
+         ' of the n_neighbors nearest. default=None')
+def neighbors(in_ordination: str, output: str, query_ordination: str,
+              n_neighbors: int, radius: float) -> None:
+    """ Nearest samples in the RPCA sample loadings """
+
+    samples = OrdinationResults.read(in_ordination).samples
+    index = SampleIndex(samples)
+    if query_ordination is None:
+        queries, query_ids = None, samples.index
+    else:
+        queries = OrdinationResults.read(query_ordination).samples
+        queries = queries[samples.columns]
+        query_ids = queries.index
+    if radius is None:
+        indices, distances = index.kneighbors(queries, n_neighbors)
+    else:
+        indices, distances = index.radius_neighbors(queries, radius)
+    counts = [len(ind) for ind in indices]
+    neighbor_ids = np.asarray(samples.index)
+    pd.DataFrame({'sample': np.repeat(np.asarray(query_ids), counts),
+                  'neighbor': neighbor_ids[np.concatenate(indices)],
+                  'distance': np.concatenate(distances)}).to_csv(
+        output, sep='\t', index=False)
+    return
+
+
+if __name__ == '__main__':
+    neighbors()
@@ -1,11 +1,13 @@
 import os
 import skbio
 import click
+import numpy as np
 import pandas as pd
 from biom import load_table
 from skbio import OrdinationResults
 from deicode.optspace import OptSpace
-from deicode.preprocessing import rclr
+from deicode.distance import distance_to_disk, knn_distance
+from deicode.preprocessing import rclr, rclr_hdf5
 
 
 @click.command()
@@ -19,36 +21,122 @@ from deicode.preprocessing import rclr
     '--min_sample_depth',
     default=500,
     help='Minimum Sample Sequencing Depth Cut Off default=500')
+@click.option(
+    '--dtype',
+    default='float64',
+    type=click.Choice(['float64', 'float32']),
+    help='Floating point precision of the computation. default=float64')
+@click.option(
+    '--block_size',
+    default=None,
+    type=int,
+    help='Stream the table from the biom HDF5 file in blocks of'
+         ' this many samples, the rclr table is written to'
+         ' output_dir/rclr_store and never densified. Features'
+         ' absent from every sample are removed. default=None'
+         ' (the table is loaded in memory)')
+@click.option(
+    '--n_jobs',
+    default=1,
+    help='The number of threads OptSpace is run on,'
+         ' -1 uses all the cores. default=1')
+@click.option(
+    '--n_starts',
+    default=1,
+    help='The number of independent OptSpace starts, the one with'
+         ' the lowest final distortion is kept. default=1')
+@click.option(
+    '--checkpoint',
+    default=None,
+    help='File the OptSpace (RPCA) run is checkpointed to after'
+         ' each iteration. If it exists the run resumes from it.'
+         ' default=None')
+@click.option(
+    '--time_budget',
+    default=None,
+    type=float,
+    help='Wall-clock seconds after which OptSpace (RPCA) stops with'
+         ' the best solution so far. default=None')
+@click.option(
+    '--rtol',
+    default=None,
+    type=float,
+    help='OptSpace (RPCA) stops once an iteration reduces the'
+         ' distortion by less than this fraction. default=None')
+@click.option(
+    '--memory_limit',
+    default=None,
+    type=float,
+    help='Memory in MB OptSpace (RPCA) may use, the run is not'
+         ' started if its projected peak exceeds it. This is an'
+         ' estimate checked before the run, not a hard cap.'
+         ' default=None')
+@click.option(
+    '--distance',
+    default='dense',
+    type=click.Choice(['dense', 'npy', 'knn', 'none']),
+    help='The sample distance output: RPCA_distance.txt (dense),'
+         ' a float32 RPCA_distance.npy written in blocks and never'
+         ' held in memory (npy), the n_neighbors nearest samples'
+         ' of each sample in RPCA_knn.tsv (knn) or none.'
+         ' default=dense')
+@click.option(
+    '--n_neighbors',
+    default=10,
+    help='The neighbors per sample of --distance knn. default=10')
 def rpca(in_biom: str, output_dir: str,
-         min_sample_depth: int, rank: int) -> None:
+         min_sample_depth: int, rank: int, dtype: str,
+         block_size: int, n_jobs: int, n_starts: int,
+         checkpoint: str, time_budget: float, rtol: float,
+         memory_limit: float, distance: str, n_neighbors: int) -> None:
     """ Runs RPCA with an rclr preprocessing step"""
 
-    # import table
-    table = load_table(in_biom)
-    # filter sample to min depth
+    dtype = np.dtype(dtype)
+    if block_size is not None:
+        # streaming rclr preprocessing and OptSpace (RPCA)
+        store = rclr_hdf5(in_biom, os.path.join(output_dir, 'rclr_store'),
+                          min_sample_count=min_sample_depth,
+                          block_size=block_size, dtype=dtype)
+        opt = OptSpace(rank=rank, dtype=dtype, block_size=block_size,
+                       n_jobs=n_jobs, n_starts=n_starts,
+                       checkpoint=checkpoint, time_budget=time_budget,
+                       rtol=rtol, memory_limit=memory_limit).fit(store)
+        sample_ids, feature_ids = store.sample_ids, store.feature_ids
+    else:
+        # import table
+        table = load_table(in_biom)
+        # filter sample to min depth
+
+        def sample_filter(val, id_, md): return sum(val) > min_sample_depth
+        table = table.filter(sample_filter, axis='sample')
+        table = table.to_dataframe().T.drop_duplicates()
+        # rclr for saving the transformed OTU table (RSC edited)
+        tablefit = rclr(dtype=dtype).fit_transform(table.copy())
+        U,s,V = OptSpace(dtype=dtype, n_jobs=n_jobs).fit_transform(tablefit)
+        tablefit = np.dot(np.dot(U, s), V.T)
+        tablefit = pd.DataFrame(tablefit.T, index=table.columns, columns=table.index)
+        with open(os.path.join(output_dir, 'rclr_OTUtable.txt'), 'w'):
+            tablefit.to_csv(os.path.join(output_dir, 'rclr_OTUtable.txt'), sep='\t', index_label='OTU_ID')
 
-    def sample_filter(val, id_, md): return sum(val) > min_sample_depth
-    table = table.filter(sample_filter, axis='sample')
-    table = table.to_dataframe().T.drop_duplicates()
-    # rclr for saving the transformed OTU table (RSC edited)
-    tablefit = rclr().fit_transform(table.copy())
-    U,s,V = OptSpace().fit_transform(tablefit)
-    tablefit = np.dot(np.dot(U, s), V.T)
-    tablefit = pd.DataFrame(tablefit.T, index=table.columns, columns=table.index)
-    with open(os.path.join(output_dir, 'rclr_OTUtable.txt'), 'w'):
-        tablefit.to_csv(os.path.join(output_dir, 'rclr_OTUtable.txt'), sep='\t', index_label='OTU_ID')
-    
-    # rclr preprocessing and OptSpace (RPCA)
-    opt = OptSpace(rank=rank).fit(rclr().fit_transform(table.copy()))
+        # rclr preprocessing and OptSpace (RPCA)
+        opt = OptSpace(rank=rank, dtype=dtype, n_jobs=n_jobs,
+                       n_starts=n_starts, checkpoint=checkpoint,
+                       time_budget=time_budget, rtol=rtol,
+                       memory_limit=memory_limit).fit(
+            rclr(dtype=dtype).fit_transform(table.copy()))
+        sample_ids, feature_ids = table.index, table.columns
+    # the biplot is of the SVD of the solution, its
+    # eigenvalues are then the whole of the fitted s
+    opt.rotate()
     rename_cols = {i - 1: 'PC' + str(i) for i in range(1, rank + 1)}
 
     # Feature Loadings
-    feature_loading = pd.DataFrame(opt.feature_weights, index=table.columns)
+    feature_loading = pd.DataFrame(opt.feature_weights, index=feature_ids)
     feature_loading = feature_loading.rename(columns=rename_cols)
     feature_loading.sort_values('PC1', inplace=True, ascending=True)
 
     # Sample Loadings
-    sample_loading = pd.DataFrame(opt.sample_weights, index=table.index)
+    sample_loading = pd.DataFrame(opt.sample_weights, index=sample_ids)
     sample_loading = sample_loading.rename(columns=rename_cols)
 
     proportion_explained = pd.Series(opt.explained_variance_ratio,
@@ -66,9 +154,23 @@ def rpca(in_biom: str, output_dir: str,
     # write files to output folder
     ord_res.write(os.path.join(output_dir, 'RPCA_Ordination.txt'))
     # save distance matrix
-    dist_res = skbio.stats.distance.DistanceMatrix(
-        opt.distance, ids=sample_loading.index)
-    dist_res.write(os.path.join(output_dir, 'RPCA_distance.txt'))
+    if distance == 'dense':
+        dist_res = skbio.stats.distance.DistanceMatrix(
+            opt.distance, ids=sample_loading.index)
+        dist_res.write(os.path.join(output_dir, 'RPCA_distance.txt'))
+    elif distance == 'npy':
+        distance_to_disk(opt.sample_weights,
+                         os.path.join(output_dir, 'RPCA_distance.npy'))
+        pd.Series(sample_loading.index).to_csv(
+            os.path.join(output_dir, 'RPCA_distance_ids.txt'),
+            index=False, header=False)
+    elif distance == 'knn':
+        indices, distances = knn_distance(opt.sample_weights, n_neighbors)
+        ids = np.asarray(sample_loading.index)
+        pd.DataFrame({'sample': np.repeat(ids, n_neighbors),
+                      'neighbor': ids[indices.ravel()],
+                      'distance': distances.ravel()}).to_csv(
+            os.path.join(output_dir, 'RPCA_knn.tsv'), sep='\t', index=False)
     return
 
 
@@ -1,5 +1,9 @@
 from deicode.scripts._rpca import rpca
+import os
+import shutil
+import tempfile
 import unittest
+import numpy as np
 import pandas as pd
 from click.testing import CliRunner
 from skbio.util import get_data_path
@@ -29,6 +33,58 @@ class Test_rpca(unittest.TestCase):
         assert_array_almost_equal(samp_res.values, samp_exp.values)
         self.assertEqual(result.exit_code, 0)
 
+    def test_rpca_block_size(self):
+        in_ = get_data_path('test.biom')
+        out_ = tempfile.mkdtemp()
+        try:
+            runner = CliRunner()
+            result = runner.invoke(rpca, ['--in_biom', in_,
+                                          '--output_dir', out_,
+                                          '--block_size', 16])
+            self.assertEqual(result.exit_code, 0)
+            samp_res = pd.read_table(os.path.join(out_, 'RPCA_distance.txt'),
+                                     index_col=0)
+            self.assertEqual(samp_res.shape, (200, 200))
+            self.assertTrue(os.path.exists(os.path.join(out_, 'rclr_store')))
+        finally:
+            shutil.rmtree(out_)
+
+    def test_rpca_float32(self):
+        in_ = get_data_path('test.biom')
+        out_ = tempfile.mkdtemp()
+        try:
+            runner = CliRunner()
+            result = runner.invoke(rpca, ['--in_biom', in_,
+                                          '--output_dir', out_,
+                                          '--rank', 4,
+                                          '--dtype', 'float32'])
+            self.assertEqual(result.exit_code, 0)
+            dist = pd.read_table(os.path.join(out_, 'RPCA_distance.txt'),
+                                 index_col=0)
+            self.assertEqual(dist.shape, (200, 200))
+        finally:
+            shutil.rmtree(out_)
+
+    def test_rpca_distance(self):
+        in_ = get_data_path('test.biom')
+        out_ = tempfile.mkdtemp()
+        try:
+            runner = CliRunner()
+            for option in ['npy', 'knn']:
+                result = runner.invoke(rpca, ['--in_biom', in_,
+                                              '--output_dir', out_,
+                                              '--distance', option,
+                                              '--n_neighbors', 5])
+                self.assertEqual(result.exit_code, 0)
+            dist = np.load(os.path.join(out_, 'RPCA_distance.npy'))
+            self.assertEqual(dist.shape, (200, 200))
+            knn = pd.read_table(os.path.join(out_, 'RPCA_knn.tsv'))
+            self.assertEqual(knn.shape, (1000, 3))
+            self.assertFalse(os.path.exists(
+                os.path.join(out_, 'RPCA_distance.txt')))
+        finally:
+            shutil.rmtree(out_)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,43 @@
+from deicode.scripts._rpca import rpca
+from deicode.scripts._neighbors import neighbors
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from click.testing import CliRunner
+from skbio.util import get_data_path
+
+
+class Test_neighbors(unittest.TestCase):
+    def setUp(self):
+        self.out_ = tempfile.mkdtemp()
+        CliRunner().invoke(rpca, ['--in_biom', get_data_path('test.biom'),
+                                  '--output_dir', self.out_,
+                                  '--distance', 'none'])
+        self.ord_ = os.path.join(self.out_, 'RPCA_Ordination.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.out_)
+
+    def test_neighbors(self):
+        out_ = os.path.join(self.out_, 'knn.tsv')
+        runner = CliRunner()
+        result = runner.invoke(neighbors, ['--in_ordination', self.ord_,
+                                           '--output', out_,
+                                           '--n_neighbors', 5])
+        self.assertEqual(result.exit_code, 0)
+        res = pd.read_table(out_)
+        self.assertEqual(res.shape, (1000, 3))
+        self.assertFalse((res['sample'] == res['neighbor']).any())
+        result = runner.invoke(neighbors, ['--in_ordination', self.ord_,
+                                           '--query_ordination', self.ord_,
+                                           '--output', out_,
+                                           '--radius', .5])
+        self.assertEqual(result.exit_code, 0)
+        res = pd.read_table(out_)
+        self.assertTrue((res['distance'] <= .5).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
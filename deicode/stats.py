@@ -0,0 +1,277 @@
+import numpy as np
+import pandas as pd
+from deicode._parallel import map_shared
+
+
+def permanova(sample_weights, grouping, column=None, permutations=999,
+              seed=None, batch_size=100, n_jobs=1):
+    """
+
+    PERMANOVA of the RPCA distances directly on the sample
+    loadings. The distances of RPCA are Euclidean in the
+    rank-r loadings, so the within group sum of squared
+    distances is that of each sample to its group centroid
+    and the pseudo-F of a permutation costs O(M*rank)
+    instead of the O(M^2) of a scan of the distance matrix.
+    The permutations are evaluated in vectorized batches.
+
+    The test statistic and, for the same seed, the p-value are
+    those of skbio.stats.distance.permanova on the distance
+    matrix of the loadings (up to floating point rounding).
+
+    Parameters
+    ----------
+
+    sample_weights: OptSpace, skbio.OrdinationResults,
+    pandas.DataFrame or numpy.ndarray - the sample loadings
+    of shape (M,rank) of a fit or an RPCA biplot
+
+    grouping: list, pandas.Series or pandas.DataFrame
+    The group of each sample, a Series or DataFrame is
+    aligned to the sample IDs of the loadings.
+
+    column: str, optional : Default is None
+    The column of grouping when it is a DataFrame.
+
+    permutations: int, optional : Default is 999
+    The number of permutations of the p-value.
+
+    seed: int or numpy.random.Generator, optional
+    The seed of the permutations.
+
+    batch_size: int, optional : Default is 100
+    The number of permutations evaluated at once.
+
+    n_jobs: int, optional : Default is 1
+    The number of processes the batches run on,
+    -1 uses all the cores.
+
+    Returns
+    -------
+
+    pandas.Series - the results, as in skbio.stats.distance
+
+    Raises
+    ------
+    ValueError
+
+    Raises an error if grouping is not of the size of the samples
+        `ValueError: grouping must have a group for each sample`.
+
+    Raises an error if there is one group or one sample per group
+        `ValueError: grouping must have more than one group and
+        fewer groups than samples`.
+
+    Examples
+    --------
+
+    >>> from deicode.stats import permanova
+    >>> opt = OptSpace(rank=3).fit(table_rclr)
+    >>> permanova(opt, metadata, column='body_site', n_jobs=4)
+
+    """
+
+    return _test('PERMANOVA', 'pseudo-F', _pseudo_f, sample_weights,
+                 grouping, column, permutations, seed, batch_size, n_jobs)
+
+
+def permdisp(sample_weights, grouping, column=None, test='median',
+             permutations=999, seed=None, batch_size=100, n_jobs=1):
+    """
+
+    PERMDISP of the RPCA distances directly on the sample
+    loadings, the F-value of a one way ANOVA of the distances
+    of the samples to the median (or centroid) of their group
+    in the rank-r loadings. A permutation costs O(M*rank)
+    (times the iterations of the spatial median) and the
+    permutations are evaluated in vectorized batches.
+
+    The test statistic and, for the same seed, the p-value are
+    those of skbio.stats.distance.permdisp on the distance
+    matrix of the loadings (up to floating point rounding,
+    and to the 1e-7 tolerance of the spatial median).
+
+    Parameters
+    ----------
+
+    sample_weights, grouping, column, permutations, seed,
+    batch_size, n_jobs: as in permanova
+
+    test: str, optional : Default is median
+    The center of the groups, median or centroid.
+
+    Returns
+    -------
+
+    pandas.Series - the results, as in skbio.stats.distance
+
+    Raises
+    ------
+    ValueError
+
+    Raises an error if test is not one of median or centroid
+        `ValueError: test must be one of median or centroid`.
+
+    Raises the errors of permanova.
+
+    """
+
+    if test not in ('median', 'centroid'):
+        raise ValueError('test must be one of median or centroid')
+    statistic = _median_f if test == 'median' else _centroid_f
+    return _test('PERMDISP', 'F-value', statistic, sample_weights,
+                 grouping, column, permutations, seed, batch_size, n_jobs)
+
+
+def _test(method, statistic_name, statistic, sample_weights, grouping,
+          column, permutations, seed, batch_size, n_jobs):
+    """ the statistic and its permutation p-value """
+
+    X, ids = _loadings(sample_weights)
+    # both tests are invariant to a translation
+    X = X - X.mean(axis=0)
+    n = X.shape[0]
+    if isinstance(grouping, pd.DataFrame):
+        grouping = grouping[column]
+    if isinstance(grouping, pd.Series) and ids is not None:
+        grouping = grouping.loc[ids]
+    if len(grouping) != n:
+        raise ValueError('grouping must have a group for each sample')
+    groups, labels = np.unique(np.asarray(grouping), return_inverse=True)
+    num_groups = len(groups)
+    if not 1 < num_groups < n:
+        raise ValueError('grouping must have more than one group and '
+                         'fewer groups than samples')
+
+    stat = statistic(X, labels[None], num_groups)[0]
+    p_value = np.nan
+    if permutations > 0:
+        # the permutations of skbio for the same seed
+        rng = seed
+        if not isinstance(rng, np.random.Generator):
+            rng = np.random.default_rng(seed)
+        batches = [np.array([rng.permutation(labels)
+                             for _ in range(start, min(start + batch_size,
+                                                       permutations))])
+                   for start in range(0, permutations, batch_size)]
+        stats = np.concatenate(map_shared(
+            _batch, batches, (statistic, X, num_groups), n_jobs))
+        p_value = ((stats >= stat).sum() + 1) / (permutations + 1)
+
+    return pd.Series([method, statistic_name, n, num_groups, stat,
+                      p_value, permutations],
+                     index=['method name', 'test statistic name',
+                            'sample size', 'number of groups',
+                            'test statistic', 'p-value',
+                            'number of permutations'],
+                     name='%s results' % method)
+
+
+def _batch(shared, labels):
+    """ the statistic of a batch of permuted labels """
+
+    statistic, X, num_groups = shared
+    return statistic(X, labels, num_groups)
+
+
+def _loadings(sample_weights):
+    """ the loadings as an array and their sample IDs (or None) """
+
+    if hasattr(sample_weights, 'samples'):
+        # skbio.OrdinationResults
+        sample_weights = sample_weights.samples
+    if hasattr(sample_weights, 'sample_weights'):
+        # OptSpace
+        return (np.asarray(sample_weights.sample_weights, dtype=np.float64),
+                sample_weights.sample_ids)
+    if isinstance(sample_weights, pd.DataFrame):
+        return (sample_weights.values.astype(np.float64),
+                list(sample_weights.index))
+    return np.asarray(sample_weights, dtype=np.float64), None
+
+
+def _group_sums(values, labels, num_groups):
+    """ the sums (B, groups, k) of values (B, M, k) by labels (B, M) """
+
+    B, n = labels.shape
+    values = np.broadcast_to(values, (B, n, values.shape[-1]))
+    index = (labels + num_groups * np.arange(B)[:, None]).ravel()
+    sums = [np.bincount(index, weights=values[..., j].ravel(),
+                        minlength=B * num_groups)
+            for j in range(values.shape[-1])]
+    return np.stack(sums, axis=1).reshape(B, num_groups, -1)
+
+
+def _pseudo_f(X, labels, num_groups):
+    """ the PERMANOVA pseudo-F of each row of labels """
+
+    n = X.shape[0]
+    sizes = np.bincount(labels[0], minlength=num_groups)
+    s_T = (X ** 2).sum()
+    sums = _group_sums(X, labels, num_groups)
+    s_W = s_T - ((sums ** 2).sum(axis=2) / sizes).sum(axis=1)
+    return ((s_T - s_W) / (num_groups - 1)) / (s_W / (n - num_groups))
+
+
+def _centroid_f(X, labels, num_groups):
+    """ the PERMDISP F-value to the group centroids """
+
+    sizes = np.bincount(labels[0], minlength=num_groups)
+    centers = _group_sums(X, labels, num_groups) / sizes[:, None]
+    return _anova_f(X, labels, centers, sizes)
+
+
+def _median_f(X, labels, num_groups):
+    """ the PERMDISP F-value to the group spatial medians """
+
+    sizes = np.bincount(labels[0], minlength=num_groups)
+    centers = _group_sums(X, labels, num_groups) / sizes[:, None]
+    centers = _geomedian(X, labels, centers, sizes)
+    return _anova_f(X, labels, centers, sizes)
+
+
+def _geomedian(X, labels, y, sizes, eps=1e-7, maxiters=500):
+    """
+    The spatial median of each group from the centroids y,
+    the modified Weiszfeld iteration of Vardi and Zhang
+    (as in skbio and hdmedians) over all groups at once
+    """
+
+    rows = np.arange(labels.shape[0])[:, None]
+    active = np.ones(y.shape[:2], dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(maxiters):
+            D = np.sqrt(((X - y[rows, labels]) ** 2).sum(axis=2))
+            far = D > eps
+            Dinv = np.where(far, 1 / np.where(far, D, 1), 0)[..., None]
+            Dinvs = _group_sums(Dinv, labels, y.shape[1])
+            T = _group_sums(Dinv * X, labels, y.shape[1]) / Dinvs
+            nzeros = sizes - _group_sums(far[..., None], labels,
+                                         y.shape[1])[..., 0]
+            r = np.sqrt((((T - y) * Dinvs) ** 2).sum(axis=2))
+            rinv = np.where(r > eps, nzeros / np.where(r > eps, r, 1), 0)
+            y1 = np.where((nzeros == 0)[..., None], T,
+                          np.maximum(0, 1 - rinv)[..., None] * T +
+                          np.minimum(1, rinv)[..., None] * y)
+            done = ((nzeros == sizes) |
+                    (np.sqrt(((y - y1) ** 2).sum(axis=2)) < eps))
+            y = np.where((active & ~done)[..., None], y1, y)
+            active &= ~done
+            if not active.any():
+                break
+    return y
+
+
+def _anova_f(X, labels, centers, sizes):
+    """ the one way ANOVA F-value of the distances to centers """
+
+    B, n = labels.shape
+    num_groups = len(sizes)
+    rows = np.arange(B)[:, None]
+    z = np.sqrt(((X - centers[rows, labels]) ** 2).sum(axis=2))
+    means = _group_sums(z[..., None], labels, num_groups)[..., 0] / sizes
+    grand = z.mean(axis=1)
+    ss_between = (sizes * (means - grand[:, None]) ** 2).sum(axis=1)
+    ss_within = ((z - means[rows, labels]) ** 2).sum(axis=1)
+    return ((ss_between / (num_groups - 1)) /
+            (ss_within / (n - num_groups)))
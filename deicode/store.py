@@ -0,0 +1,133 @@
+import os
+import json
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class CSRStore(object):
+
+    def __init__(self, path, mmap_mode='r'):
+        """
+
+        An on-disk (samples, features) matrix in compressed
+        sparse row format. The data, indices and indptr
+        arrays are uncompressed .npy files that are
+        memory-mapped, so only the blocks of rows that
+        are read are brought into memory.
+
+        Parameters
+        ----------
+
+        path: str - the directory of the store
+        (as written by CSRStore.create)
+
+        mmap_mode: str, optional : Default is 'r'
+        The numpy.load memory-map mode of the arrays.
+
+        Raises
+        ------
+        ValueError
+
+        Raises an error if the path is not a store
+            `ValueError: path is not a CSRStore`.
+
+        Examples
+        --------
+
+        >>> from deicode.preprocessing import rclr_hdf5
+        >>> from deicode.store import CSRStore
+
+        rclr preprocessing written to a store
+
+        >>> store = rclr_hdf5('table.biom', 'rclr-store')
+
+        reading it back in blocks of 1000 samples
+
+        >>> store = CSRStore('rclr-store')
+        >>> for start, block in store.blocks(1000):
+        ...     pass
+
+        """
+
+        meta_path = os.path.join(path, 'store.json')
+        if not os.path.exists(meta_path):
+            raise ValueError('path is not a CSRStore')
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.path = path
+        self.shape = tuple(meta['shape'])
+        self.data = np.load(os.path.join(path, 'data.npy'),
+                            mmap_mode=mmap_mode)
+        self.indices = np.load(os.path.join(path, 'indices.npy'),
+                               mmap_mode=mmap_mode)
+        self.indptr = np.load(os.path.join(path, 'indptr.npy'),
+                              mmap_mode=mmap_mode)
+        self.sample_ids = _read_ids(os.path.join(path, 'sample_ids.txt'))
+        self.feature_ids = _read_ids(os.path.join(path, 'feature_ids.txt'))
+
+        return
+
+    @classmethod
+    def create(cls, path, shape, nnz, dtype, sample_ids, feature_ids):
+        """ allocates an empty store on disk, opened for writing """
+
+        os.makedirs(path, exist_ok=True)
+        index_dtype = np.int32 if max(nnz, shape[1]) < 2 ** 31 else np.int64
+        np.lib.format.open_memmap(os.path.join(path, 'data.npy'), mode='w+',
+                                  dtype=dtype, shape=(nnz,))
+        np.lib.format.open_memmap(os.path.join(path, 'indices.npy'),
+                                  mode='w+', dtype=index_dtype, shape=(nnz,))
+        np.lib.format.open_memmap(os.path.join(path, 'indptr.npy'),
+                                  mode='w+', dtype=index_dtype,
+                                  shape=(shape[0] + 1,))
+        _write_ids(os.path.join(path, 'sample_ids.txt'), sample_ids)
+        _write_ids(os.path.join(path, 'feature_ids.txt'), feature_ids)
+        with open(os.path.join(path, 'store.json'), 'w') as f:
+            json.dump({'shape': [int(shape[0]), int(shape[1])],
+                       'nnz': int(nnz),
+                       'dtype': np.dtype(dtype).str}, f)
+        return cls(path, mmap_mode='r+')
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def blocks(self, block_size):
+        """ yields (first row, csr_matrix) for blocks of block_size rows """
+
+        n, m = self.shape
+        for start in range(0, n, block_size):
+            stop = min(n, start + block_size)
+            indptr = np.array(self.indptr[start:stop + 1])
+            lo, hi = indptr[0], indptr[-1]
+            yield start, csr_matrix((np.array(self.data[lo:hi]),
+                                     np.array(self.indices[lo:hi]),
+                                     indptr - lo), shape=(stop - start, m))
+
+    def tocsr(self):
+        """ a csr_matrix backed by the memory-mapped arrays """
+
+        return csr_matrix((self.data, self.indices, self.indptr),
+                          shape=self.shape, copy=False)
+
+    def flush(self):
+        """ writes any changes to the arrays back to disk """
+
+        for array in [self.data, self.indices, self.indptr]:
+            if isinstance(array, np.memmap):
+                array.flush()
+
+
+def _write_ids(path, ids):
+    with open(path, 'w') as f:
+        for id_ in ids:
+            f.write('%s\n' % id_)
+
+
+def _read_ids(path):
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f]
@@ -0,0 +1,43 @@
+import unittest
+import tempfile
+import numpy as np
+import numpy.testing as npt
+from scipy.spatial.distance import pdist, squareform
+from deicode.distance import (condensed_distance, distance_to_disk,
+                              knn_distance)
+
+
+class TestDistance(unittest.TestCase):
+    def setUp(self):
+        self.U = np.random.RandomState(0).randn(23, 3)
+        self.exp = pdist(self.U)
+
+    def test_condensed_distance(self):
+        for block_size in [1, 5, 100]:
+            npt.assert_allclose(condensed_distance(
+                self.U, block_size=block_size), self.exp)
+        res = condensed_distance(self.U, dtype=np.float32, block_size=4)
+        self.assertEqual(res.dtype, np.float32)
+        npt.assert_allclose(res, self.exp, rtol=1e-6)
+
+    def test_distance_to_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            res = distance_to_disk(self.U, tmp + '/d.npy', block_size=4)
+            self.assertEqual(res.dtype, np.float32)
+            npt.assert_allclose(res, squareform(self.exp), atol=1e-6)
+            res = distance_to_disk(self.U, tmp + '/c.npy', np.float64,
+                                   block_size=4, condensed=True)
+            npt.assert_allclose(np.load(tmp + '/c.npy'), self.exp)
+
+    def test_knn_distance(self):
+        D = squareform(self.exp)
+        np.fill_diagonal(D, np.inf)
+        indices, distances = knn_distance(self.U, 4, block_size=5)
+        npt.assert_array_equal(indices, np.argsort(D, axis=1)[:, :4])
+        npt.assert_allclose(distances, np.sort(D, axis=1)[:, :4])
+        with self.assertRaises(ValueError):
+            knn_distance(self.U, 23)
+
+
+if __name__ == "__main__":
+    unittest.main()
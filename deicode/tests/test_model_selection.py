@@ -0,0 +1,71 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+from scipy.sparse import csr_matrix
+from deicode.model_selection import rank_selection
+
+
+class TestRankSelection(unittest.TestCase):
+    def setUp(self):
+        # noisy rank 3 matrix with ~50% of the entries missing
+        rand = np.random.RandomState(0)
+        n, m, r = 40, 60, 3
+        M0 = rand.randn(n, r).dot(rand.randn(r, m)) + .3 * rand.randn(n, m)
+        self.M_E = np.multiply(M0, rand.rand(n, m) < .5)
+
+    def test_rank_selection(self):
+        errors, rank = rank_selection(self.M_E, ranks=[1, 2, 3, 4, 5],
+                                      iterations=[5, 20], n_splits=2,
+                                      random_state=0)
+        self.assertEqual(rank, 3)
+        self.assertEqual(len(errors), 2 * 5 * 2)
+        self.assertEqual(list(errors.columns),
+                         ['split', 'rank', 'iterations',
+                          'train_error', 'test_error'])
+        # the held out error drops until the true rank
+        mean_error = errors.groupby('rank').test_error.min()
+        self.assertTrue((np.diff(mean_error.values[:3]) < 0).all())
+
+    def test_rank_selection_n_jobs(self):
+        exp, _ = rank_selection(self.M_E, ranks=[2, 3], iterations=[5],
+                                n_splits=2, random_state=0)
+        res, _ = rank_selection(csr_matrix(self.M_E), ranks=[2, 3],
+                                iterations=[5], n_splits=2, n_jobs=2,
+                                random_state=0)
+        npt.assert_allclose(res.test_error, exp.test_error)
+
+    def test_rank_selection_duplicates(self):
+        exp, _ = rank_selection(self.M_E, ranks=[2, 3], iterations=[5],
+                                n_splits=1, random_state=0)
+        res, _ = rank_selection(self.M_E, ranks=[3, 2, 3],
+                                iterations=[5, 5], n_splits=1,
+                                random_state=0)
+        npt.assert_allclose(res.test_error, exp.test_error)
+
+    def test_rank_selection_iterations(self):
+        # each number of iterations is scored as its own fit
+        res, _ = rank_selection(self.M_E, ranks=[2], iterations=[5, 10],
+                                n_splits=1, random_state=0)
+        for k in [5, 10]:
+            exp, _ = rank_selection(self.M_E, ranks=[2], iterations=[k],
+                                    n_splits=1, random_state=0)
+            npt.assert_allclose(res[res.iterations == k].test_error,
+                                exp.test_error)
+        # a run that stops on tol scores its final fit
+        res, _ = rank_selection(self.M_E, ranks=[2], iterations=[5, 10],
+                                n_splits=1, tol=1e3, random_state=0)
+        npt.assert_allclose(res.test_error[0], res.test_error[1])
+
+    def test_rank_selection_errors(self):
+        with self.assertRaises(ValueError):
+            rank_selection(self.M_E, holdout=1.5)
+        with self.assertRaises(ValueError):
+            rank_selection(self.M_E, ranks=[40])
+        with self.assertRaises(ValueError):
+            rank_selection(self.M_E, ranks=[0, 2])
+        with self.assertRaises(ValueError):
+            rank_selection(self.M_E, iterations=[0, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+import pandas as pd
+import numpy.testing as npt
+from scipy.spatial.distance import cdist
+from deicode.neighbors import SampleIndex
+from deicode.optspace import OptSpace
+
+
+class TestSampleIndex(unittest.TestCase):
+    def setUp(self):
+        rand = np.random.RandomState(0)
+        self.U = rand.randn(50, 3)
+        self.Q = rand.randn(7, 3)
+        self.index = SampleIndex(self.U)
+
+    def test_kneighbors(self):
+        D = cdist(self.Q, self.U)
+        indices, distances = self.index.kneighbors(self.Q, n_neighbors=5)
+        npt.assert_array_equal(indices, np.argsort(D, axis=1)[:, :5])
+        npt.assert_allclose(distances, np.sort(D, axis=1)[:, :5])
+        # the indexed samples are not their own neighbors
+        D = cdist(self.U, self.U)
+        np.fill_diagonal(D, np.inf)
+        indices, distances = self.index.kneighbors(n_neighbors=5)
+        npt.assert_array_equal(indices, np.argsort(D, axis=1)[:, :5])
+        npt.assert_allclose(distances, np.sort(D, axis=1)[:, :5])
+        with self.assertRaises(ValueError):
+            self.index.kneighbors(n_neighbors=50)
+
+    def test_radius_neighbors(self):
+        D = cdist(self.Q, self.U)
+        indices, distances = self.index.radius_neighbors(self.Q, 1.)
+        for row, ind, dist in zip(D, indices, distances):
+            exp = np.flatnonzero(row <= 1.)
+            npt.assert_array_equal(ind, exp[np.argsort(row[exp])])
+            npt.assert_allclose(dist, np.sort(row[exp]))
+        indices, _ = self.index.radius_neighbors(radius=1.)
+        for i, ind in enumerate(indices):
+            self.assertNotIn(i, ind)
+
+    def test_OptSpace_sample_index(self):
+        M = pd.DataFrame(self.U.dot(np.random.RandomState(1).randn(3, 40)),
+                         index=['s%i' % i for i in range(50)])
+        M[M.abs() < .5] = np.nan
+        opt = OptSpace(rank=3).fit(M)
+        index = opt.sample_index()
+        self.assertEqual(index.sample_ids, list(M.index))
+        exp = cdist(opt.sample_weights, opt.sample_weights)
+        np.fill_diagonal(exp, np.inf)
+        indices, _ = index.kneighbors(n_neighbors=3)
+        npt.assert_array_equal(indices, np.argsort(exp, axis=1)[:, :3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,6 @@
-from deicode._optspace import (G, F_t, gradF_t, Gp, getoptT, getoptS, optspace)
+from deicode._optspace import (G, F_t, gradF_t, Gp, getoptT, getoptS,
+                               getoptS_system, solveS, residual, optspace,
+                               randomized_svds, svd_init)
 import numpy as np
 from numpy.linalg import norm
 import unittest
@@ -114,6 +116,52 @@ class TestOptspace(unittest.TestCase):
         exp = -9.5367431640625e-08
         npt.assert_allclose(exp, res)
 
+    def test_getoptT_random(self):
+        # compare against backtracking with full F_t evaluations
+        np.random.seed(0)
+        n, m, r = 12, 9, 3
+        X = np.linalg.qr(np.random.randn(n, r))[0] * np.sqrt(n)
+        Y = np.linalg.qr(np.random.randn(m, r))[0] * np.sqrt(m)
+        S = np.random.randn(r, r)
+        E = np.random.choice([0, 1], size=(n, m))
+        M_E = np.multiply(np.random.randn(n, m), E)
+        m0 = 10000
+        rho = 0.5
+        W, Z = gradF_t(X, Y, S, M_E, E, m0, rho)
+        norm2WZ = norm(W, 'fro')**2 + norm(Z, 'fro')**2
+        f0 = F_t(X, Y, S, M_E, E, m0, rho)
+        exp = -1e-1
+        for i in range(20):
+            f = F_t(X + exp * W, Y + exp * Z, S, M_E, E, m0, rho)
+            if f - f0 <= .5 * exp * norm2WZ:
+                break
+            exp = exp / 2
+        res = getoptT(X, W, Y, Z, S, M_E, E, m0, rho)
+        self.assertEqual(res, exp)
+        self.assertEqual(res, -0.025)
+
+    def test_workspace(self):
+        # a shared residual and row blocks give the same results
+        np.random.seed(0)
+        n, m, r = 12, 9, 3
+        X = np.linalg.qr(np.random.randn(n, r))[0] * np.sqrt(n)
+        Y = np.linalg.qr(np.random.randn(m, r))[0] * np.sqrt(m)
+        S = np.random.randn(r, r)
+        E = np.random.choice([0, 1], size=(n, m))
+        M_E = np.multiply(np.random.randn(n, m), E)
+        m0 = 10000
+        rho = 0.5
+        R = residual(X, S, Y, M_E, E)
+        npt.assert_allclose(R, np.multiply(M_E - X.dot(S).dot(Y.T), E))
+        exp = gradF_t(X, Y, S, M_E, E, m0, rho)
+        res = gradF_t(X, Y, S, M_E, E, m0, rho, R=R)
+        npt.assert_allclose(res[0], exp[0])
+        npt.assert_allclose(res[1], exp[1])
+        W, Z = exp
+        exp = getoptT(X, W, Y, Z, S, M_E, E, m0, rho)
+        res = getoptT(X, W, Y, Z, S, M_E, E, m0, rho, R=R, chunk_size=20)
+        self.assertEqual(res, exp)
+
     def test_getoptS_small(self):
         # warning : this test must ALWAYS pass
         data = loadmat(get_data_path('small_test.mat'))
@@ -129,6 +177,64 @@ class TestOptspace(unittest.TestCase):
                         [0.00729038, 0.00785834, 0.67853083]])
         npt.assert_allclose(res, exp, atol=1e-5)
 
+    def test_getoptS_loop(self):
+        # compare against the explicit r^2 loop construction
+        np.random.seed(0)
+        n, m, r = 12, 9, 3
+        X = np.random.randn(n, r)
+        Y = np.random.randn(m, r)
+        E = np.random.choice([0, 1], size=(n, m))
+        M_E = np.multiply(np.random.randn(n, m), E)
+        C = np.ravel(X.T.dot(M_E).dot(Y))
+        A = np.zeros((r * r, r * r))
+        for i in range(r):
+            for j in range(r):
+                tmp = np.multiply(np.outer(X[:, i], Y[:, j]), E)
+                A[:, j * r + i] = np.ravel(X.T.dot(tmp).dot(Y))
+        exp = np.linalg.lstsq(A, C, rcond=1e-12)[0].reshape((r, r)).T
+        npt.assert_allclose(getoptS(X, Y, M_E, E), exp)
+        # chunking the observed entries does not change the system
+        rows, cols = np.nonzero(E)
+        npt.assert_allclose(getoptS_system(X, Y, rows, cols, chunk_size=20),
+                            getoptS_system(X, Y, rows, cols))
+
+    def test_solveS(self):
+        np.random.seed(0)
+        n, m, r = 30, 25, 4
+        X = np.random.randn(n, r)
+        Y = np.random.randn(m, r)
+        E = np.random.choice([0, 1], size=(n, m))
+        M_E = np.multiply(np.random.randn(n, m), E)
+        exp = getoptS(X, Y, M_E, E)
+        for solver in ['cholesky', 'cg']:
+            res = getoptS(X, Y, M_E, E, solver=solver)
+            npt.assert_allclose(res, exp, atol=1e-7)
+        # a singular system falls back to lstsq
+        rows, cols = np.nonzero(E[:, :1])
+        A = getoptS_system(X, Y, rows, cols)
+        C = np.random.randn(r * r)
+        exp = np.linalg.lstsq(A, C, rcond=1e-12)[0]
+        for solver in ['cholesky', 'cg']:
+            res = solveS(A, C, X, Y, .5, solver=solver)
+            npt.assert_allclose(res, exp)
+        with self.assertRaises(ValueError):
+            solveS(A, C, X, Y, .5, solver='qr')
+
+    def test_randomized_svds(self):
+        rand = np.random.RandomState(0)
+        M = rand.randn(50, 4).dot(rand.randn(4, 80))
+        U, s, Vt = randomized_svds(M, 3, random_state=0)
+        exp = np.linalg.svd(M, compute_uv=False)[:3][::-1]
+        npt.assert_allclose(s, exp)
+        npt.assert_allclose(U.T.dot(M).dot(Vt.T), np.diag(s), atol=1e-8)
+        res = randomized_svds(M, 3, random_state=0)
+        npt.assert_array_equal(res[0], U)
+        for init in ['svds', 'randomized']:
+            res = svd_init(M, 3, init=init, random_state=0)
+            npt.assert_allclose(res[1], exp)
+        with self.assertRaises(ValueError):
+            svd_init(M, 3, init='qr')
+
     def test_optspace_original(self):
         M0 = loadmat(get_data_path('large_test.mat'))['M0']
         M_E = loadmat(get_data_path('large_test.mat'))['M_E']
@@ -0,0 +1,473 @@
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+import numpy.testing as npt
+from numpy.linalg import norm
+from biom import Table
+from scipy.sparse import coo_matrix, csr_matrix
+from deicode import _optspace
+from deicode import _optspace_sparse
+from deicode.optspace import OptSpace
+from deicode.preprocessing import rclr
+from deicode.store import CSRStore
+
+
+class TestOptspaceSparse(unittest.TestCase):
+    def setUp(self):
+        # low-rank matrix with ~50% of the entries missing
+        rand = np.random.RandomState(0)
+        n, m, r = 40, 60, 3
+        self.r = r
+        self.M0 = rand.randn(n, r).dot(rand.randn(r, m))
+        self.E = (rand.rand(n, m) < .5).astype(int)
+        self.M_E = np.multiply(self.M0, self.E)
+        self.M_sp = coo_matrix(self.M_E)
+        self.X = rand.randn(n, r)
+        self.Y = rand.randn(m, r)
+        self.S = rand.randn(r, r)
+        self.m0 = 10000
+        self.rho = .5
+
+    def test_F_t(self):
+        exp = _optspace.F_t(self.X, self.Y, self.S,
+                            self.M_E, self.E, self.m0, self.rho)
+        res = _optspace_sparse.F_t(self.X, self.Y, self.S,
+                                   self.M_sp, self.m0, self.rho)
+        self.assertAlmostEqual(res, exp)
+
+    def test_gradF_t(self):
+        exp = _optspace.gradF_t(self.X, self.Y, self.S,
+                                self.M_E, self.E, self.m0, self.rho)
+        res = _optspace_sparse.gradF_t(self.X, self.Y, self.S,
+                                       self.M_sp, self.m0, self.rho)
+        npt.assert_allclose(res[0], exp[0])
+        npt.assert_allclose(res[1], exp[1])
+
+    def test_getoptT(self):
+        W, Z = _optspace.gradF_t(self.X, self.Y, self.S,
+                                 self.M_E, self.E, self.m0, self.rho)
+        exp = _optspace.getoptT(self.X, W, self.Y, Z, self.S,
+                                self.M_E, self.E, self.m0, self.rho)
+        res = _optspace_sparse.getoptT(self.X, W, self.Y, Z, self.S,
+                                       self.M_sp, self.m0, self.rho)
+        self.assertAlmostEqual(res, exp)
+
+    def test_getoptS(self):
+        exp = _optspace.getoptS(self.X, self.Y, self.M_E, self.E)
+        res = _optspace_sparse.getoptS(self.X, self.Y, self.M_sp)
+        npt.assert_allclose(res, exp, atol=1e-8)
+
+    def test_optspace(self):
+        M_E = self.M_E.copy()
+        M_E[0, 0] = np.nan
+        X, S, Y, dist = _optspace_sparse.optspace(csr_matrix(M_E),
+                                                  r=self.r, niter=20,
+                                                  tol=1e-8)
+        err = norm(X.dot(S).dot(Y.T) - self.M0) / norm(self.M0)
+        self.assertLess(err, 1e-2)
+        self.assertEqual(X.shape, (M_E.shape[0], self.r))
+        self.assertEqual(Y.shape, (M_E.shape[1], self.r))
+
+    def test_OptSpace_sparse_input(self):
+        exp = OptSpace(rank=self.r, iteration=20).fit(self.M_E)
+        res = OptSpace(rank=self.r, iteration=20).fit(csr_matrix(self.M_E))
+        npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+
+    def test_OptSpace_solver(self):
+        exp = OptSpace(rank=self.r, iteration=20).fit(csr_matrix(self.M_E))
+        for solver in ['cholesky', 'cg']:
+            res = OptSpace(rank=self.r, iteration=20,
+                           solver=solver).fit(csr_matrix(self.M_E))
+            npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+        with self.assertRaises(ValueError):
+            OptSpace(rank=self.r, solver='qr').fit(self.M_E)
+
+    def test_OptSpace_float32(self):
+        for X in [self.M_E, csr_matrix(self.M_E)]:
+            exp = OptSpace(rank=self.r, iteration=20).fit(X)
+            res = OptSpace(rank=self.r, iteration=20,
+                           dtype=np.float32).fit(X)
+            self.assertEqual(res.sample_weights.dtype, np.float32)
+            err = norm(res.solution - exp.solution) / norm(exp.solution)
+            self.assertLess(err, 1e-4)
+            # past rank 3 the scalars of G and Gp exceed 2**16
+            res = OptSpace(rank=5, iteration=5, dtype=np.float32).fit(X)
+            for weights in [res.sample_weights, res.s, res.feature_weights]:
+                self.assertEqual(weights.dtype, np.float32)
+
+    def test_OptSpace_sparse_rclr(self):
+        rand = np.random.RandomState(0)
+        counts = rand.poisson(np.exp(self.M0 / 4))
+        exp = OptSpace(rank=self.r, iteration=20).fit(
+            rclr().fit_transform(counts))
+        res = OptSpace(rank=self.r, iteration=20).fit(
+            rclr().fit_transform(csr_matrix(counts)))
+        npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+
+    def test_OptSpace_biom_input(self):
+        n, m = self.M_E.shape
+        table = Table(self.M_E.T, ['F%d' % i for i in range(m)],
+                      ['S%d' % i for i in range(n)])
+        res = OptSpace(rank=self.r, iteration=20).fit(table)
+        self.assertEqual(res.sample_weights.shape, (n, self.r))
+        self.assertEqual(res.feature_weights.shape, (m, self.r))
+        err = norm(res.solution - self.M0) / norm(self.M0)
+        self.assertLess(err, 1e-2)
+
+    def _store(self, path):
+        X = csr_matrix(self.M_E)
+        n, m = X.shape
+        store = CSRStore.create(path, X.shape, X.nnz, X.dtype,
+                                ['S%d' % i for i in range(n)],
+                                ['F%d' % i for i in range(m)])
+        store.data[:] = X.data
+        store.indices[:] = X.indices
+        store.indptr[:] = X.indptr
+        store.flush()
+        return CSRStore(path)
+
+    def test_store_kernels(self):
+        with tempfile.TemporaryDirectory() as path:
+            M_st = _optspace_sparse._StoreEntries(self._store(path),
+                                                  block_size=7)
+            args = (self.X, self.Y, self.S)
+            self.assertAlmostEqual(
+                _optspace_sparse.F_t(*args, M_st, self.m0, self.rho),
+                _optspace_sparse.F_t(*args, self.M_sp, self.m0, self.rho))
+            W, Z = _optspace_sparse.gradF_t(*args, self.M_sp,
+                                            self.m0, self.rho)
+            res = _optspace_sparse.gradF_t(*args, M_st, self.m0, self.rho)
+            npt.assert_allclose(res[0], W)
+            npt.assert_allclose(res[1], Z)
+            self.assertAlmostEqual(
+                _optspace_sparse.getoptT(self.X, W, self.Y, Z, self.S,
+                                         M_st, self.m0, self.rho),
+                _optspace_sparse.getoptT(self.X, W, self.Y, Z, self.S,
+                                         self.M_sp, self.m0, self.rho))
+            npt.assert_allclose(
+                _optspace_sparse.getoptS(self.X, self.Y, M_st),
+                _optspace_sparse.getoptS(self.X, self.Y, self.M_sp))
+
+    def test_OptSpace_store_input(self):
+        exp = OptSpace(rank=self.r, iteration=20).fit(csr_matrix(self.M_E))
+        with tempfile.TemporaryDirectory() as path:
+            res = OptSpace(rank=self.r, iteration=20,
+                           block_size=7).fit(self._store(path))
+        npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+
+    def test_row_blocks_kernels(self):
+        M_rb = _optspace_sparse._RowBlocks(self.M_sp, 5)
+        self.assertEqual(sum(b.nnz for _, b in M_rb), self.M_sp.nnz)
+        args = (self.X, self.Y, self.S)
+        self.assertAlmostEqual(
+            _optspace_sparse.F_t(*args, M_rb, self.m0, self.rho),
+            _optspace_sparse.F_t(*args, self.M_sp, self.m0, self.rho))
+        W, Z = _optspace_sparse.gradF_t(*args, self.M_sp, self.m0, self.rho)
+        res = _optspace_sparse.gradF_t(*args, M_rb, self.m0, self.rho)
+        npt.assert_allclose(res[0], W)
+        npt.assert_allclose(res[1], Z)
+        npt.assert_allclose(
+            _optspace_sparse.getoptS(self.X, self.Y, M_rb),
+            _optspace_sparse.getoptS(self.X, self.Y, self.M_sp))
+
+    def test_OptSpace_n_jobs(self):
+        exp = OptSpace(rank=self.r, iteration=20).fit(self.M_E)
+        for X in [self.M_E, csr_matrix(self.M_E)]:
+            res = OptSpace(rank=self.r, iteration=20, n_jobs=3).fit(X)
+            npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+        with tempfile.TemporaryDirectory() as path:
+            res = OptSpace(rank=self.r, iteration=20, block_size=7,
+                           n_jobs=-1).fit(self._store(path))
+        npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+
+    def test_OptSpace_init(self):
+        exp = OptSpace(rank=self.r, iteration=20).fit(self.M_E)
+        for X in [self.M_E, csr_matrix(self.M_E)]:
+            res = OptSpace(rank=self.r, iteration=20, init='randomized',
+                           random_state=0).fit(X)
+            npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+        with tempfile.TemporaryDirectory() as path:
+            res = OptSpace(rank=self.r, iteration=20, block_size=7,
+                           init='randomized',
+                           random_state=0).fit(self._store(path))
+        npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+        with self.assertRaises(ValueError):
+            OptSpace(rank=self.r, init='qr').fit(self.M_E)
+
+    def test_fold_in(self):
+        U, s, Vt = np.linalg.svd(self.M0, full_matrices=False)
+        U, S, V = U[:, :self.r], np.diag(s[:self.r]), Vt[:self.r].T
+        npt.assert_allclose(_optspace_sparse.fold_in(self.M_sp, V, S),
+                            U, atol=1e-8)
+        npt.assert_allclose(_optspace_sparse.fold_in(self.M_sp, U, S,
+                                                     axis=1),
+                            V, atol=1e-8)
+        with tempfile.TemporaryDirectory() as path:
+            M_st = _optspace_sparse._StoreEntries(self._store(path),
+                                                  block_size=7)
+            npt.assert_allclose(_optspace_sparse.fold_in(M_st, U, S,
+                                                         axis=1),
+                                V, atol=1e-8)
+
+    def test_OptSpace_warm_start(self):
+        n, m = self.M_E.shape
+        M_E = pd.DataFrame(self.M_E, ['S%d' % i for i in range(n)],
+                           ['F%d' % i for i in range(m)])
+        # a previous fit missing samples and features
+        prev = OptSpace(rank=self.r, iteration=20).fit(M_E.iloc[5:, 5:])
+        cold = OptSpace(rank=self.r, iteration=2).fit(M_E)
+        for init in [prev, (pd.DataFrame(prev.sample_weights,
+                                         prev.sample_ids),
+                            prev.s,
+                            pd.DataFrame(prev.feature_weights,
+                                         prev.feature_ids))]:
+            res = OptSpace(rank=self.r, iteration=2).fit(M_E, init=init)
+            self.assertEqual(res.sample_ids, list(M_E.index))
+            err = norm(res.solution - self.M0) / norm(self.M0)
+            cold_err = norm(cold.solution - self.M0) / norm(self.M0)
+            self.assertLess(err, 1e-2)
+            self.assertLess(err, cold_err)
+        # factors without IDs must match the shape
+        exp = OptSpace(rank=self.r, iteration=20).fit(self.M_E)
+        res = OptSpace(rank=self.r, iteration=2).fit(
+            csr_matrix(self.M_E),
+            init=(exp.sample_weights, exp.s, exp.feature_weights))
+        err = norm(res.solution - exp.solution) / norm(exp.solution)
+        self.assertLess(err, 1e-3)
+        with self.assertRaises(ValueError):
+            OptSpace(rank=self.r).fit(self.M_E[5:], init=exp)
+        with self.assertRaises(ValueError):
+            OptSpace(rank=self.r + 1).fit(self.M_E, init=exp)
+
+    def test_OptSpace_transform(self):
+        n, m = self.M_E.shape
+        M_E = pd.DataFrame(self.M_E, ['S%d' % i for i in range(n)],
+                           ['F%d' % i for i in range(m)])
+        opt = OptSpace(rank=self.r, iteration=20).fit(M_E)
+        npt.assert_array_equal(opt.transform(), opt.sample_weights)
+        # features are aligned by ID and unknown ones ignored
+        new = M_E.iloc[:, ::-1].copy()
+        new['unknown'] = 1.
+        for X in [new, Table(new.values.T, list(new.columns),
+                             list(new.index))]:
+            res = opt.transform(X)
+            npt.assert_allclose(res, opt.sample_weights, atol=1e-3)
+        res = opt.transform(csr_matrix(self.M_E[:5]))
+        npt.assert_allclose(res, opt.sample_weights[:5], atol=1e-3)
+        with self.assertRaises(ValueError):
+            opt.transform(self.M_E[:, 1:])
+
+    def test_OptSpace_partial_fit(self):
+        n, m = self.M_E.shape
+        M_E = pd.DataFrame(self.M_E, ['S%d' % i for i in range(n)],
+                           ['F%d' % i for i in range(m)])
+        opt = OptSpace(rank=self.r)
+        # the first batch is missing features
+        batches = [M_E.iloc[:10, :50], M_E.iloc[10:20],
+                   csr_matrix(self.M_E[20:30]), M_E.iloc[30:]]
+        for epoch in range(3):
+            for batch in batches:
+                opt.partial_fit(batch)
+        self.assertEqual(opt.n_samples_seen, 3 * n)
+        self.assertEqual(opt.feature_system[0].shape, (m, self.r, self.r))
+        self.assertEqual(opt.feature_ids, list(M_E.columns))
+        U = opt.transform(M_E)
+        err = (norm(U.dot(opt.s).dot(opt.feature_weights.T) - self.M0)
+               / norm(self.M0))
+        self.assertLess(err, 5e-2)
+        opt = OptSpace(rank=self.r)
+        with self.assertRaises(ValueError):
+            opt.partial_fit(M_E.iloc[:self.r])
+        # the fit is not started by the failed batch
+        opt.partial_fit(M_E)
+        self.assertEqual(opt.n_samples_seen, n)
+
+    def test_OptSpace_n_starts(self):
+        exp = OptSpace(rank=self.r, iteration=20).fit(self.M_E)
+        for n_jobs in [1, 2]:
+            res = OptSpace(rank=self.r, iteration=20, n_starts=3,
+                           n_jobs=n_jobs, random_state=0).fit(self.M_E)
+            diagnostics = res.start_diagnostics
+            self.assertEqual(len(diagnostics), 3)
+            self.assertEqual(len(set(diagnostics.seed)), 3)
+            npt.assert_allclose(res.solution, exp.solution, atol=1e-6)
+        # the same seeds give the same starts on any number of jobs
+        res_ = OptSpace(rank=self.r, iteration=20, n_starts=3,
+                        random_state=0).fit(csr_matrix(self.M_E))
+        npt.assert_allclose(res_.start_diagnostics.distortion,
+                            diagnostics.distortion, rtol=1e-6)
+        with self.assertRaises(ValueError):
+            OptSpace(rank=self.r, n_starts=0).fit(self.M_E)
+
+    def test_OptSpace_snapshots(self):
+        for X in [self.M_E, csr_matrix(self.M_E)]:
+            res = OptSpace(rank=self.r, iteration=20, random_state=0,
+                           snapshots=[1, 5, 20]).fit(X)
+            self.assertEqual(list(res.path), [1, 5, 20])
+            npt.assert_allclose(res.path[20].solution, res.solution)
+            for k in [1, 5]:
+                exp = OptSpace(rank=self.r, iteration=k,
+                               random_state=0).fit(X)
+                npt.assert_allclose(res.path[k].solution, exp.solution)
+                npt.assert_allclose(res.path[k].distance, exp.distance)
+            self.assertGreater(res.path[1].distortion,
+                               res.path[20].distortion)
+        with self.assertRaises(ValueError):
+            OptSpace(rank=self.r, iteration=5,
+                     snapshots=[10]).fit(self.M_E)
+
+    def test_OptSpace_rotate(self):
+        exp = OptSpace(rank=self.r, random_state=0).fit(self.M_E)
+        res = OptSpace(rank=self.r, random_state=0).fit(self.M_E).rotate()
+        npt.assert_allclose(res.solution, exp.solution)
+        npt.assert_allclose(res.distance, exp.distance)
+        npt.assert_allclose(res.s, np.diag(res.eigenvalues))
+        self.assertTrue((np.diff(res.eigenvalues) >= 0).all())
+
+    def test_OptSpace_checkpoint(self):
+        for X in [self.M_E, csr_matrix(self.M_E)]:
+            exp = OptSpace(rank=self.r, iteration=20, tol=1e-12,
+                           random_state=0).fit(X)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = tmp + '/checkpoint.npz'
+                # interrupted after 5 iterations and resumed
+                OptSpace(rank=self.r, iteration=5, tol=1e-12,
+                         random_state=0, checkpoint=path).fit(X)
+                res = OptSpace(rank=self.r, iteration=20, tol=1e-12,
+                               checkpoint=path).fit(X)
+                npt.assert_array_equal(res.solution, exp.solution)
+                npt.assert_array_equal(res.sample_weights,
+                                       exp.sample_weights)
+                with self.assertRaises(ValueError):
+                    OptSpace(rank=self.r, iteration=20,
+                             checkpoint=path).fit(2 * X)
+            # the best iterate and rtol carry over a resume
+            exp = OptSpace(rank=self.r, iteration=50, tol=1e-12,
+                           random_state=0, rtol=.21,
+                           time_budget=1e6).fit(X)
+            self.assertEqual(exp.status, 'rtol')
+            # interrupted just before the iteration that stops
+            stop = np.flatnonzero(exp.distortion_history)[-1]
+            with tempfile.TemporaryDirectory() as tmp:
+                path = tmp + '/checkpoint.npz'
+                OptSpace(rank=self.r, iteration=stop - 1, tol=1e-12,
+                         rtol=.21, random_state=0,
+                         checkpoint=path).fit(X)
+                res = OptSpace(rank=self.r, iteration=50, tol=1e-12,
+                               rtol=.21, time_budget=1e6,
+                               checkpoint=path).fit(X)
+                self.assertEqual(res.status, 'rtol')
+                npt.assert_array_equal(res.solution, exp.solution)
+                # a refit on the finished checkpoint is the same
+                res = OptSpace(rank=self.r, iteration=50, tol=1e-12,
+                               rtol=.21, time_budget=1e6,
+                               checkpoint=path).fit(X)
+                self.assertEqual(res.status, 'rtol')
+                npt.assert_array_equal(res.solution, exp.solution)
+                npt.assert_array_equal(res.sample_weights,
+                                       exp.sample_weights)
+                with self.assertRaises(ValueError):
+                    OptSpace(rank=self.r, iteration=5,
+                             checkpoint=path).fit(X)
+            # a refit on the checkpoint of a run
+            # that did all its iterations is the same
+            with tempfile.TemporaryDirectory() as tmp:
+                path = tmp + '/checkpoint.npz'
+                exp = OptSpace(rank=self.r, iteration=5, tol=1e-12,
+                               random_state=0, checkpoint=path).fit(X)
+                res = OptSpace(rank=self.r, iteration=5, tol=1e-12,
+                               checkpoint=path).fit(X)
+                self.assertEqual(res.status, 'iteration')
+                npt.assert_array_equal(res.sample_weights,
+                                       exp.sample_weights)
+
+    def test_OptSpace_budgets(self):
+        for X in [self.M_E, csr_matrix(self.M_E)]:
+            res = OptSpace(rank=self.r, iteration=3, tol=1e-12,
+                           random_state=0).fit(X)
+            self.assertEqual(res.status, 'iteration')
+            res = OptSpace(rank=self.r, iteration=20, tol=1e-2,
+                           random_state=0).fit(X)
+            self.assertEqual(res.status, 'tol')
+            # no time left after the initialization
+            res = OptSpace(rank=self.r, iteration=20, random_state=0,
+                           time_budget=0, snapshots=[1]).fit(X)
+            self.assertEqual(res.status, 'time_budget')
+            npt.assert_allclose(res.solution, res.path[1].solution)
+            res = OptSpace(rank=self.r, iteration=50, tol=1e-12,
+                           random_state=0, rtol=.5).fit(X)
+            self.assertEqual(res.status, 'rtol')
+            with self.assertRaises(ValueError):
+                OptSpace(rank=self.r, memory_limit=1e-3).fit(X)
+            OptSpace(rank=self.r, memory_limit=100).fit(X)
+
+    def test_OptSpace_exact(self):
+        # an exact warm start, every distortion is 0
+        X = np.full((4, 4), 2.)
+        init = (np.full((4, 1), .5), np.eye(1) * 8, np.full((4, 1), .5))
+        for n_starts in [1, 2]:
+            res = OptSpace(rank=1, n_starts=n_starts,
+                           snapshots=[3]).fit(X, init=init)
+            self.assertEqual(res.status, 'tol')
+            npt.assert_allclose(res.solution, X)
+            self.assertEqual(res.path[3].distortion, 0)
+
+    def test_OptSpace_predict(self):
+        res = OptSpace(rank=self.r).fit(self.M_E)
+        exp = res.sample_weights.dot(res.s).dot(res.feature_weights.T)
+        npt.assert_allclose(res.solution, exp)
+        blocks = list(res.solution_blocks(block_size=7))
+        self.assertEqual([start for start, _ in blocks],
+                         list(range(0, 40, 7)))
+        npt.assert_allclose(np.vstack([b for _, b in blocks]), exp)
+        npt.assert_allclose(res.predict([3, 1], [5, 0, 2]),
+                            exp[np.ix_([3, 1], [5, 0, 2])])
+        npt.assert_allclose(res.predict([3, 1], [5, 0], paired=True),
+                            exp[[3, 1], [5, 0]])
+        # by the IDs of the fit
+        table = pd.DataFrame(self.M_E,
+                             index=['s%i' % i for i in range(40)],
+                             columns=['f%i' % i for i in range(60)])
+        res = OptSpace(rank=self.r).fit(table)
+        pred = res.predict(['s3', 's1'], ['f5', 'f0'])
+        self.assertEqual(list(pred.index), ['s3', 's1'])
+        npt.assert_allclose(pred, res.solution[np.ix_([3, 1], [5, 0])])
+        self.assertEqual(res.predict().shape, (40, 60))
+        with self.assertRaises(ValueError):
+            res.predict(['s3'], ['f60'])
+
+    def test_OptSpace_save_load(self):
+        counts = np.random.RandomState(1).poisson(
+            np.exp(self.M0 / 2)) * self.E
+        table = pd.DataFrame(counts,
+                             index=['s%i' % i for i in range(40)],
+                             columns=['f%i' % i for i in range(60)])
+        transform = rclr()
+        table = pd.DataFrame(transform.fit_transform(table),
+                             index=table.index, columns=table.columns)
+        exp = OptSpace(rank=self.r, random_state=0).fit(table)
+        with tempfile.TemporaryDirectory() as tmp:
+            exp.save(tmp + '/model', centering=transform.centering)
+            res = OptSpace.load(tmp + '/model')
+            self.assertIsInstance(res.feature_weights, np.memmap)
+            for name in ['sample_weights', 's', 'feature_weights',
+                         'distortion_history', 'solution', 'eigenvalues']:
+                npt.assert_array_equal(getattr(res, name),
+                                       getattr(exp, name))
+            npt.assert_array_equal(res.centering, transform.centering)
+            self.assertEqual(res.sample_ids, exp.sample_ids)
+            self.assertEqual(res.feature_ids, exp.feature_ids)
+            self.assertEqual(res.rescal_param, exp.rescal_param)
+            self.assertEqual(res.status, exp.status)
+            self.assertEqual((res.rank, res.random_state), (self.r, 0))
+            npt.assert_allclose(res.explained_variance_ratio,
+                                exp.explained_variance_ratio)
+            npt.assert_allclose(res.transform(table.iloc[:5]),
+                                exp.transform(table.iloc[:5]))
+            with self.assertRaises(ValueError):
+                OptSpace.load(tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,16 @@
+import os
+import shutil
+import tempfile
 import unittest
+import h5py
 import numpy as np
 import numpy.testing as npt
-from deicode.preprocessing import rclr, inverse_rclr
+from biom import Table
+from scipy.sparse import csr_matrix
+from deicode.preprocessing import (rclr, inverse_rclr, rclr_hdf5,
+                                   inverse_rclr_blocks)
 from skbio.stats.composition import closure, clr
+from deicode.optspace import OptSpace
 
 
 class Testpreprocessing(unittest.TestCase):
@@ -33,6 +41,74 @@ class Testpreprocessing(unittest.TestCase):
         with self.assertRaises(ValueError):
             self._rclr.fit_transform(self.bad1)
 
+    def test_rclr_sparse(self):
+        np.random.seed(0)
+        counts = np.random.poisson(.5, size=(20, 30))
+        counts = counts[counts.sum(axis=1) > 0]
+        exp = self._rclr.fit_transform(counts)
+        res = self._rclr.fit_transform(csr_matrix(counts))
+        self.assertIsInstance(res, csr_matrix)
+        # only the nonzero counts are stored
+        stored = res.copy()
+        stored.data[:] = 1
+        npt.assert_array_equal(stored.toarray(), counts != 0)
+        res = res.toarray()
+        res[counts == 0] = np.nan
+        npt.assert_allclose(res, exp)
+        # biom tables are (features, samples)
+        table = Table(counts.T,
+                      ['F%d' % i for i in range(counts.shape[1])],
+                      ['S%d' % i for i in range(counts.shape[0])])
+        res = self._rclr.fit_transform(table).toarray()
+        res[counts == 0] = np.nan
+        npt.assert_allclose(res, exp)
+
+        with self.assertRaises(ValueError):
+            self._rclr.fit_transform(csr_matrix(self.bad1))
+
+    def test_rclr_hdf5(self):
+        np.random.seed(0)
+        counts = np.random.poisson(2, size=(30, 40))
+        counts[:, 3] = 0
+        sample_ids = ['S%d' % i for i in range(counts.shape[0])]
+        feature_ids = ['F%d' % i for i in range(counts.shape[1])]
+        table = Table(counts.T, feature_ids, sample_ids)
+        tmp = tempfile.mkdtemp()
+        try:
+            biom_path = os.path.join(tmp, 'table.biom')
+            with h5py.File(biom_path, 'w') as f:
+                table.to_hdf5(f, 'test')
+            store = rclr_hdf5(biom_path, os.path.join(tmp, 'store'),
+                              min_sample_count=80, min_feature_count=20,
+                              block_size=7)
+            keep_samples = counts.sum(axis=1) > 80
+            keep_features = counts[keep_samples].sum(axis=0) > 20
+            kept = counts[keep_samples][:, keep_features]
+            self.assertEqual(store.shape, kept.shape)
+            self.assertEqual(store.sample_ids,
+                             list(np.array(sample_ids)[keep_samples]))
+            self.assertEqual(store.feature_ids,
+                             list(np.array(feature_ids)[keep_features]))
+            res = store.tocsr().toarray()
+            res[kept == 0] = np.nan
+            npt.assert_allclose(res, self._rclr.fit_transform(kept))
+            # reading back in blocks gives the same rows
+            blocks = [block.toarray() for _, block in store.blocks(4)]
+            npt.assert_allclose(np.vstack(blocks),
+                                store.tocsr().toarray())
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_rclr_dtype(self):
+        exp = self._rclr.fit_transform(self.cdata2)
+        res = rclr(dtype=np.float32).fit_transform(self.cdata2)
+        self.assertEqual(res.dtype, np.float32)
+        npt.assert_allclose(res, exp, rtol=1e-6)
+        res = inverse_rclr(dtype=np.float32).fit_transform(
+            self._rclr.fit_transform(self.cdata1))
+        self.assertEqual(res.dtype, np.float32)
+        npt.assert_allclose(res, closure(self.cdata1), rtol=1e-6)
+
     def test_inverse_rclr(self):
 
         cmat = self._rclr.fit_transform(self.cdata1)
@@ -43,3 +119,37 @@ class Testpreprocessing(unittest.TestCase):
         # inverse can not take zero, nan, or inf values (value error)
 
         pass
+
+    def test_rclr_centering(self):
+        exp = np.array([np.log(.5), np.mean(np.log([4 / 6, 2 / 6]))])
+        npt.assert_allclose(rclr().fit(self.cdata2).centering, exp)
+        npt.assert_allclose(
+            rclr().fit(csr_matrix(self.cdata2)).centering, exp)
+
+    def test_inverse_rclr_blocks(self):
+        rand = np.random.RandomState(0)
+        clr_ = rand.randn(11, 7) * 5
+        exp = closure(np.exp(clr_))
+        npt.assert_allclose(inverse_rclr_blocks(clr_, block_size=4), exp)
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'clr.npy')
+            np.save(path, clr_)
+            res = inverse_rclr_blocks(np.load(path, mmap_mode='r'),
+                                      os.path.join(tmp, 'comp.npy'),
+                                      block_size=3)
+            npt.assert_allclose(res, exp)
+            res = inverse_rclr_blocks(clr_, os.path.join(tmp, 'top.npz'),
+                                      top_k=2, block_size=4)
+            top = np.sort(exp, axis=1)[:, -2:]
+            npt.assert_allclose(np.sort(res.toarray(), axis=1)[:, -2:], top)
+            self.assertEqual(res.nnz, 22)
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'top.npz')))
+        finally:
+            shutil.rmtree(tmp)
+        # the solution of a fit, one block of samples at a time
+        opt = OptSpace(rank=2).fit(clr_)
+        npt.assert_allclose(inverse_rclr_blocks(opt, block_size=4),
+                            closure(np.exp(opt.solution)))
+        with self.assertRaises(ValueError):
+            inverse_rclr_blocks(clr_, top_k=8)
@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import pandas as pd
+import numpy.testing as npt
+from scipy.spatial.distance import cdist
+from skbio import DistanceMatrix, OrdinationResults
+from skbio.stats.distance import permanova as sk_permanova
+from skbio.stats.distance import permdisp as sk_permdisp
+from deicode.stats import permanova, permdisp
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        rand = np.random.RandomState(0)
+        ids = ['s%i' % i for i in range(30)]
+        self.U = pd.DataFrame(rand.randn(30, 3), index=ids)
+        self.U.iloc[:10] += .8
+        self.U.iloc[10:20] *= 2
+        self.grouping = pd.Series(list('abc') * 10, index=ids,
+                                  name='group')
+        self.grouping = self.grouping.sort_values(kind='stable')
+        self.dm = DistanceMatrix(cdist(self.U, self.U), ids=ids)
+
+    def _compare(self, res, exp, rtol=1e-7):
+        npt.assert_allclose(res['test statistic'], exp['test statistic'],
+                            rtol=rtol)
+        self.assertEqual(res['p-value'], exp['p-value'])
+        self.assertEqual(res['number of groups'], exp['number of groups'])
+
+    def test_permanova(self):
+        exp = sk_permanova(self.dm, self.grouping, permutations=99, seed=0)
+        for n_jobs in [1, 2]:
+            res = permanova(self.U, self.grouping, permutations=99,
+                            seed=0, batch_size=16, n_jobs=n_jobs)
+            self._compare(res, exp)
+
+    def test_permdisp(self):
+        ordination = OrdinationResults('PCoA', 'PCoA',
+                                       pd.Series(np.ones(3)),
+                                       samples=self.U.copy())
+        for test in ['centroid', 'median']:
+            exp = sk_permdisp(ordination, self.grouping, test=test,
+                              permutations=99, seed=0)
+            res = permdisp(self.U, self.grouping, test=test,
+                           permutations=99, seed=0, batch_size=16)
+            self._compare(res, exp, rtol=1e-5)
+        with self.assertRaises(ValueError):
+            permdisp(self.U, self.grouping, test='mean')
+
+    def test_grouping(self):
+        with self.assertRaises(ValueError):
+            permanova(self.U.values, ['a'] * 30)
+        with self.assertRaises(ValueError):
+            permanova(self.U.values, ['a'] * 29)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -108,7 +108,9 @@ setup(name='deicode',
       classifiers=classifiers,
       entry_points={
           'qiime2.plugins': ['q2-deicode=deicode.q2.plugin_setup:plugin'],
-          'console_scripts': ['deicode=deicode.scripts._rpca:rpca']
+          'console_scripts': [
+              'deicode=deicode.scripts._rpca:rpca',
+              'deicode_neighbors=deicode.scripts._neighbors:neighbors']
       },
       package_data={},
       cmdclass={'install': CustomInstallCommand,